@@ -1,8 +1,14 @@
-import google.generativeai as genai
-import pandas as pd
+from __future__ import annotations
+
 from io import StringIO
+from typing import TYPE_CHECKING
+
+# pandas e o SDK do Gemini são importados no primeiro uso (imports pesados)
+if TYPE_CHECKING:
+    import pandas as pd
 
 def configure_genai(api_key):
+    import google.generativeai as genai
     genai.configure(api_key=api_key)
 
 def generate_ai_analysis(analysis_df: pd.DataFrame, errors_df: pd.DataFrame) -> list:
@@ -10,7 +16,8 @@ def generate_ai_analysis(analysis_df: pd.DataFrame, errors_df: pd.DataFrame) ->
     Envia um resumo dos dados para o Gemini e solicita sugestões de gráficos
     em formato CSV padronizado.
     """
-    
+    import google.generativeai as genai
+
     # 1. Preparar os dados para o prompt
     total_linhas = len(analysis_df)
     
@@ -89,6 +96,8 @@ def parse_csv_to_charts(csv_text: str) -> list:
     """
     Transforma o CSV texto do Gemini em JSON para o frontend.
     """
+    import pandas as pd
+
     charts = {}
     try:
         # Lê o CSV gerado pela IA
@@ -1,8 +1,9 @@
 import re
 import unicodedata
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 
@@ -110,19 +111,63 @@ ROLE_ALIASES: Dict[str, Dict[str, List[str]]] = {
 }
 
 
+_RE_SPACES = re.compile(r"\s+")
+_RE_FLOAT_COD = re.compile(r"\d+\.0")
+_RE_NON_TEXT = re.compile(r"[^A-Z0-9\s/\-+]")
+
+
 def _norm_header(h: object) -> str:
     s = str(h).strip().upper()
     s = unicodedata.normalize("NFKD", s)
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _RE_SPACES.sub(" ", s).strip()
     return s
 
 
+def _build_alias_index() -> Dict[str, Dict[str, List[str]]]:
+    """ROLE_ALIASES com as variantes já normalizadas (sem duplicatas, ordem preservada)."""
+    index: Dict[str, Dict[str, List[str]]] = {}
+    for role, aliases in ROLE_ALIASES.items():
+        index[role] = {
+            canonical: list(dict.fromkeys(_norm_header(v) for v in variants))
+            for canonical, variants in aliases.items()
+        }
+    return index
+
+
+# Calculado uma vez no import; ensure_cols_by_role não renormaliza os aliases a cada chamada
+ROLE_ALIASES_NORM = _build_alias_index()
+
+
+def _build_alias_roles() -> Dict[str, Set[str]]:
+    """Cabeçalho normalizado -> roles em que ele aparece (1 role = cabeçalho exclusivo)."""
+    out: Dict[str, Set[str]] = {}
+    for role, aliases in ROLE_ALIASES_NORM.items():
+        for variants in aliases.values():
+            for v in variants:
+                out.setdefault(v, set()).add(role)
+    return out
+
+
+ALIAS_ROLES = _build_alias_roles()
+
+# Palavras no nome da aba que indicam o role (usadas só para desempate na descoberta)
+ROLE_SHEET_HINTS = {
+    "modulo": re.compile(r"\bMODULOS?\b|\bSE AUT\b"),
+    "sap": re.compile(r"\bSAP\b"),
+    "orca": re.compile(r"\bORCA|\bORCAFASCIO\b|\bORCASFACIO\b"),
+    "caderno": re.compile(r"\bCADERNO\b|\bCARDERNO\b"),
+}
+
+# Quantas linhas do topo da aba são examinadas em busca do cabeçalho
+HEADER_SCAN_ROWS = 10
+
+
 def clean_cod(c: object) -> str:
     if c is None:
         return ""
     s = str(c).strip()
-    if re.fullmatch(r"\d+\.0", s):
+    if _RE_FLOAT_COD.fullmatch(s):
         s = s[:-2]
     s = s.replace(" ", "")
     return s
@@ -134,8 +179,8 @@ def norm_text(s: object) -> str:
     s = str(s).strip().upper()
     s = unicodedata.normalize("NFKD", s)
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = re.sub(r"[^A-Z0-9\s/\-+]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _RE_NON_TEXT.sub(" ", s)
+    s = _RE_SPACES.sub(" ", s).strip()
     toks = [t for t in s.split() if t not in STOPWORDS_PT]
     return " ".join(toks)
 
@@ -146,7 +191,7 @@ def norm_unit(u: object) -> str:
     s = str(u).strip().upper()
     s = unicodedata.normalize("NFKD", s)
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _RE_SPACES.sub(" ", s).strip()
     s = s.replace(".", "").replace(",", "")
     return UNIT_MAP.get(s, s)
 
@@ -159,11 +204,10 @@ def ensure_cols_by_role(df: pd.DataFrame, sheet_name: str, role: str) -> pd.Data
     rename_map = {}
     missing = []
 
-    aliases = ROLE_ALIASES[role]
+    aliases = ROLE_ALIASES_NORM[role]
     for canonical, variants in aliases.items():
         found_original = None
-        for v in variants:
-            v_norm = _norm_header(v)
+        for v_norm in variants:
             if v_norm in norm_to_original:
                 found_original = norm_to_original[v_norm]
                 break
@@ -181,99 +225,399 @@ def ensure_cols_by_role(df: pd.DataFrame, sheet_name: str, role: str) -> pd.Data
     return df.rename(columns=rename_map)
 
 
-def load_sheet(excel_path: Path, sheet_name: str, role: str) -> pd.DataFrame:
-    df = pd.read_excel(excel_path, sheet_name=sheet_name, dtype=object)
-    df = ensure_cols_by_role(df, sheet_name=sheet_name, role=role).copy()
+def read_sheet_layout(excel_path: Path) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+    """
+    Lê apenas o cabeçalho de cada aba, numa única passada read-only do openpyxl.
+
+    O cabeçalho é a primeira linha não vazia entre as HEADER_SCAN_ROWS do topo. Devolve
+    (aba -> cabeçalhos, aba -> índice 0-based dessa linha). O índice deve ser repassado a
+    load_sheet(header=...): o pd.read_excel usa sempre a linha 1 como cabeçalho, mesmo
+    vazia, e leria 'Unnamed: 0..n' em abas com linhas em branco no topo.
+    """
+    from openpyxl import load_workbook
+
+    # Handle binário: com caminho o openpyxl exige extensão .xlsx/.xlsm no nome, e o
+    # temporário do upload pode não ter nenhuma
+    fh = open(excel_path, "rb")
+    wb = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        headers: Dict[str, List[str]] = {}
+        header_rows: Dict[str, int] = {}
+        for ws in wb.worksheets:
+            headers[ws.title] = []
+            header_rows[ws.title] = 0
+            for i, row in enumerate(ws.iter_rows(max_row=HEADER_SCAN_ROWS, values_only=True)):
+                if any(v is not None and str(v).strip() for v in row):
+                    headers[ws.title] = [str(v) for v in row if v is not None]
+                    header_rows[ws.title] = i
+                    break
+        return headers, header_rows
+    finally:
+        wb.close()
+        fh.close()
+
+
+def read_sheet_headers(excel_path: Path) -> Dict[str, List[str]]:
+    """Só os cabeçalhos de read_sheet_layout (aba -> nomes das colunas)."""
+    return read_sheet_layout(excel_path)[0]
+
+
+def _role_score(headers_norm: Set[str], sheet_name: str, role: str) -> Optional[int]:
+    """
+    Pontua o quanto a aba combina com o role, ou None se faltar coluna obrigatória.
+
+    Cabeçalhos exclusivos do role (ex.: "DESCRICAO SAP") e dicas no nome da aba
+    pesam mais; o nome exato de SHEETS_DEFAULT tem prioridade sobre tudo.
+    """
+    score = 0
+    for variants in ROLE_ALIASES_NORM[role].values():
+        found = next((v for v in variants if v in headers_norm), None)
+        if found is None:
+            return None
+        if len(ALIAS_ROLES[found]) == 1:
+            score += 2
+    if ROLE_SHEET_HINTS[role].search(_norm_header(sheet_name)):
+        score += 3
+    if sheet_name == SHEETS_DEFAULT[role]:
+        score += 100
+    return score
+
+
+def _check_sheet_role(headers: Dict[str, List[str]], name: str, role: str) -> None:
+    """Valida, só pelo cabeçalho, uma aba informada pelo chamador para o role."""
+    if role not in ROLE_ALIASES:
+        raise ValueError(f"Role inválida: {role}")
+    if name not in headers:
+        raise ValueError(f"Aba '{name}' (role={role}) não encontrada. Abas disponíveis: {list(headers)}")
+    if _role_score({_norm_header(h) for h in headers[name]}, name, role) is None:
+        # Reaproveita a mensagem de erro padrão com as colunas encontradas
+        ensure_cols_by_role(pd.DataFrame(columns=headers[name]), sheet_name=name, role=role)
+
+
+def discover_sheets(excel_path: Path, sheets: Optional[Dict[str, Optional[str]]] = None,
+                    roles: Optional[Sequence[str]] = None,
+                    headers: Optional[Dict[str, List[str]]] = None) -> Dict[str, str]:
+    """
+    Atribui uma aba a cada role (modulo/sap/orca/caderno) olhando só os cabeçalhos.
+
+    - sheets: roles já fixados pelo chamador (role -> nome da aba); os demais são descobertos.
+    - roles: roles a atribuir (padrão: todos)
+    - headers: resultado de read_sheet_headers, para não reler o arquivo
+
+    Abas fixadas são validadas contra os aliases do role antes de qualquer leitura completa.
+    Retorna um dict no formato de SHEETS_DEFAULT. Levanta ValueError se algum role não
+    puder ser atribuído de forma inequívoca.
+    """
+    roles = list(roles or ROLE_ALIASES)
+    if headers is None:
+        headers = read_sheet_headers(excel_path)
+    headers_norm = {name: {_norm_header(h) for h in hs} for name, hs in headers.items()}
+
+    assigned: Dict[str, str] = {}
+    for role, name in (sheets or {}).items():
+        if not name or role not in roles:
+            continue
+        _check_sheet_role(headers, name, role)
+        assigned[role] = name
+
+    # Candidatos (score, ordem da aba, aba, role) para os roles ainda livres
+    candidates: List[Tuple[int, int, str, str]] = []
+    for pos, name in enumerate(headers):
+        if name in assigned.values():
+            continue
+        for role in roles:
+            if role in assigned:
+                continue
+            score = _role_score(headers_norm[name], name, role)
+            if score is not None:
+                candidates.append((score, pos, name, role))
+
+    # 1) atribuição gulosa pelos candidatos com alguma evidência específica; empate no
+    #    topo (ex.: 'SAP 2023' e 'SAP 2024') é ambíguo e não é decidido pela ordem das abas
+    ranked = sorted(candidates, key=lambda c: (-c[0], c[1]))
+    for score, _, name, role in ranked:
+        if score > 0 and role not in assigned and name not in assigned.values():
+            tied = [n for s, _, n, r in ranked
+                    if r == role and s == score and n not in assigned.values()]
+            if len(tied) > 1:
+                raise ValueError(
+                    f"Abas empatadas para '{role}': {tied}. "
+                    f"Renomeie as abas ou informe qual delas usar para '{role}'."
+                )
+            assigned[role] = name
+
+    # 2) roles restantes: só atribui se sobrar exatamente uma aba compatível
+    progress = True
+    while progress:
+        progress = False
+        for role in roles:
+            if role in assigned:
+                continue
+            free = [n for _, _, n, r in candidates if r == role and n not in assigned.values()]
+            if len(free) == 1:
+                assigned[role] = free[0]
+                progress = True
+
+    missing = [r for r in roles if r not in assigned]
+    if missing:
+        raise ValueError(
+            f"Não foi possível identificar as abas para: {missing}. "
+            f"Abas e cabeçalhos encontrados: {headers}"
+        )
+    return {role: assigned[role] for role in roles}
+
+
+def discover_module_sheets(excel_path: Path,
+                           sheets: Optional[Dict[str, Optional[str]]] = None,
+                           headers: Optional[Dict[str, List[str]]] = None) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Para planilhas com várias abas de módulo: identifica as bases sap/orca/caderno e
+    devolve (abas de módulo, bases). São módulos todas as demais abas cujos cabeçalhos
+    atendem ao role 'modulo', na ordem do arquivo.
+
+    - headers: resultado de read_sheet_headers, para não reler o arquivo
+    """
+    if headers is None:
+        headers = read_sheet_headers(excel_path)
+    refs = discover_sheets(excel_path, sheets, roles=["sap", "orca", "caderno"], headers=headers)
+    taken = set(refs.values())
+    modules = [
+        name for name, hs in headers.items()
+        if name not in taken and _role_score({_norm_header(h) for h in hs}, name, "modulo") is not None
+    ]
+    if not modules:
+        raise ValueError(f"Nenhuma aba de módulo encontrada. Abas e cabeçalhos encontrados: {headers}")
+    return modules, refs
+
+
+def _arrow():
+    """Importa pyarrow sob demanda (dependência opcional, só usada no modo arrow)."""
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("O modo arrow requer o pacote pyarrow (pip install pyarrow)") from e
+    return pa
+
+
+def _is_arrow(s: pd.Series) -> bool:
+    return isinstance(s.dtype, pd.ArrowDtype)
+
+
+def _arrow_str(values):
+    """Converte para string[pyarrow] (buffers colunares em vez de objetos Python)."""
+    dtype = pd.ArrowDtype(_arrow().string())
+    if isinstance(values, pd.Series):
+        return values.astype(dtype)
+    return pd.array(values, dtype=dtype)
+
+
+def _np_bool(s) -> np.ndarray:
+    """Máscara booleana NumPy a partir de bool/bool[pyarrow] (sem nulos)."""
+    if isinstance(s, pd.Series):
+        return s.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(s, dtype=bool)
+
+
+def prepare_sheet(df: pd.DataFrame, sheet_name: str, role: str, arrow: bool = False) -> pd.DataFrame:
+    """
+    Padroniza uma aba já lida: renomeia as colunas do role, limpa COD_SAP, remove
+    códigos vazios e duplicados.
+
+    - arrow: mantém só COD_SAP/DESCRICAO/UNIDADE, em string[pyarrow]
+    """
+    df = ensure_cols_by_role(df, sheet_name=sheet_name, role=role)
+    if arrow:
+        df = df[[COL_COD, COL_DESC, COL_UN]]
+    df = df.copy()
 
     df[COL_COD] = df[COL_COD].map(clean_cod)
     df[COL_DESC] = df[COL_DESC].astype(str).fillna("")
     df[COL_UN] = df[COL_UN].astype(str).fillna("")
 
-    df = df[df[COL_COD].astype(str).str.len() > 0].copy()
+    df = df[df[COL_COD].astype(str).str.len() > 0]
     df = df.drop_duplicates(subset=[COL_COD], keep="first").reset_index(drop=True)
+    if arrow:
+        for c in (COL_COD, COL_DESC, COL_UN):
+            df[c] = _arrow_str(df[c])
     return df
 
 
-def build_analysis(modulo: pd.DataFrame, sap: pd.DataFrame, orca: pd.DataFrame, caderno: pd.DataFrame) -> pd.DataFrame:
-    m = modulo[[COL_COD, COL_DESC, COL_UN]].rename(columns={
-        COL_DESC: "desc_modulo_raw",
-        COL_UN: "un_modulo_raw",
-    }).copy()
+def load_sheet(excel_path: Union[Path, pd.ExcelFile], sheet_name: str, role: str,
+               arrow: bool = False, header: int = 0) -> pd.DataFrame:
+    """Lê a aba (cabeçalho na linha `header`, 0-based, como em read_sheet_layout) e a padroniza."""
+    df = pd.read_excel(excel_path, sheet_name=sheet_name, dtype=object, header=header)
+    return prepare_sheet(df, sheet_name=sheet_name, role=role, arrow=arrow)
 
-    sap2 = sap[[COL_COD, COL_DESC, COL_UN]].rename(columns={
-        COL_DESC: "sap_desc_raw",
-        COL_UN: "sap_un_raw",
-    })
-    orca2 = orca[[COL_COD, COL_DESC, COL_UN]].rename(columns={
-        COL_DESC: "orca_desc_raw",
-        COL_UN: "orca_un_raw",
-    })
-    cad2 = caderno[[COL_COD, COL_DESC, COL_UN]].rename(columns={
-        COL_DESC: "cad_desc_raw",
-        COL_UN: "cad_un_raw",
-    })
 
-    out = (
-        m.merge(sap2, on=COL_COD, how="left")
-         .merge(orca2, on=COL_COD, how="left")
-         .merge(cad2, on=COL_COD, how="left")
-    )
+# base -> (prefixo das colunas, flag de existência, sufixo das colunas match_*)
+REF_BASES = [
+    ("sap", "sap", "existe_no_sap", "sap"),
+    ("orca", "orca", "existe_no_orcafascio", "orca"),
+    ("caderno", "cad", "existe_no_caderno", "caderno"),
+]
+
+ANALYSIS_COLUMNS = [
+    COL_COD,
+    "desc_modulo_raw", "un_modulo_raw",
+    "sap_desc_raw", "sap_un_raw",
+    "orca_desc_raw", "orca_un_raw",
+    "cad_desc_raw", "cad_un_raw",
+    "existe_no_sap", "existe_no_orcafascio", "existe_no_caderno",
+    "desc_modulo_norm", "sap_desc_norm", "orca_desc_norm", "cad_desc_norm",
+    "un_modulo_norm", "sap_un_norm", "orca_un_norm", "cad_un_norm",
+    "match_desc_modulo_sap", "match_desc_modulo_orca", "match_desc_modulo_caderno",
+    "match_un_modulo_sap", "match_un_modulo_orca", "match_un_modulo_caderno",
+    "status_desc", "status_un",
+]
 
-    out["existe_no_sap"] = out["sap_desc_raw"].notna()
-    out["existe_no_orcafascio"] = out["orca_desc_raw"].notna()
-    out["existe_no_caderno"] = out["cad_desc_raw"].notna()
+COL_MODULO = "modulo"
 
-    out["desc_modulo_norm"] = out["desc_modulo_raw"].map(norm_text)
-    out["sap_desc_norm"] = out["sap_desc_raw"].map(norm_text)
-    out["orca_desc_norm"] = out["orca_desc_raw"].map(norm_text)
-    out["cad_desc_norm"] = out["cad_desc_raw"].map(norm_text)
+STATUS_NAO_ENCONTRADO = "NAO_ENCONTRADO_EM_NENHUMA_BASE"
 
-    out["un_modulo_norm"] = out["un_modulo_raw"].map(norm_unit)
-    out["sap_un_norm"] = out["sap_un_raw"].map(norm_unit)
-    out["orca_un_norm"] = out["orca_un_raw"].map(norm_unit)
-    out["cad_un_norm"] = out["cad_un_raw"].map(norm_unit)
 
-    out["match_desc_modulo_sap"] = (out["desc_modulo_norm"] != "") & (out["desc_modulo_norm"] == out["sap_desc_norm"])
-    out["match_desc_modulo_orca"] = (out["desc_modulo_norm"] != "") & (out["desc_modulo_norm"] == out["orca_desc_norm"])
-    out["match_desc_modulo_caderno"] = (out["desc_modulo_norm"] != "") & (out["desc_modulo_norm"] == out["cad_desc_norm"])
+def _map_unique(s: pd.Series, fn) -> pd.Series:
+    """
+    Aplica `fn` uma vez por valor distinto (descrições e unidades se repetem muito).
+
+    Em colunas string[pyarrow] o resultado é montado com um `take` sobre os valores
+    distintos, sem criar um objeto Python por linha.
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    # O código -1 (nulo) cai no último elemento, que é fn(None) == ""
+    values = [fn(v) for v in uniques] + [fn(None)]
+    if _is_arrow(s):
+        pa = _arrow()
+        import pyarrow.compute as pc
+
+        idx = np.where(codes < 0, len(uniques), codes)
+        taken = pc.take(pa.array(values, type=pa.string()), pa.array(idx))
+        return pd.Series(pd.arrays.ArrowExtensionArray(taken), index=s.index)
+    return pd.Series(np.array(values, dtype=object)[codes], index=s.index)
 
-    out["match_un_modulo_sap"] = (out["un_modulo_norm"] != "") & (out["un_modulo_norm"] == out["sap_un_norm"])
-    out["match_un_modulo_orca"] = (out["un_modulo_norm"] != "") & (out["un_modulo_norm"] == out["orca_un_norm"])
-    out["match_un_modulo_caderno"] = (out["un_modulo_norm"] != "") & (out["un_modulo_norm"] == out["cad_un_norm"])
 
-    def status_desc(row) -> str:
-        if not (row["existe_no_sap"] or row["existe_no_orcafascio"] or row["existe_no_caderno"]):
-            return "NAO_ENCONTRADO_EM_NENHUMA_BASE"
-        ok_any = bool(row["match_desc_modulo_sap"] or row["match_desc_modulo_orca"] or row["match_desc_modulo_caderno"])
-        return "OK" if ok_any else "DIVERGENTE"
+def build_reference(sap: pd.DataFrame, orca: pd.DataFrame, caderno: pd.DataFrame,
+                    codes: Optional[pd.Index] = None) -> pd.DataFrame:
+    """
+    Tabela de referência única, indexada por COD_SAP, com as colunas brutas e
+    normalizadas das três bases.
 
-    def status_un(row) -> str:
-        if not (row["existe_no_sap"] or row["existe_no_orcafascio"] or row["existe_no_caderno"]):
-            return "NAO_ENCONTRADO_EM_NENHUMA_BASE"
-        ok_any = bool(row["match_un_modulo_sap"] or row["match_un_modulo_orca"] or row["match_un_modulo_caderno"])
-        return "OK" if ok_any else "DIVERGENTE"
+    - codes: se informado, só esses COD_SAP entram (e são normalizados), de modo que o
+      custo acompanha as linhas de módulo e não o tamanho das bases.
+    """
+    parts = []
+    for (_, prefix, _, _), df in zip(REF_BASES, (sap, orca, caderno)):
+        part = df[[COL_COD, COL_DESC, COL_UN]]
+        if codes is not None:
+            part = part[part[COL_COD].isin(codes)]
+        part = part.drop_duplicates(subset=[COL_COD], keep="first").set_index(COL_COD)
+        parts.append(part.rename(columns={
+            COL_DESC: f"{prefix}_desc_raw",
+            COL_UN: f"{prefix}_un_raw",
+        }))
+
+    ref = pd.concat(parts, axis=1, join="outer")
+    for _, prefix, _, _ in REF_BASES:
+        ref[f"{prefix}_desc_norm"] = _map_unique(ref[f"{prefix}_desc_raw"], norm_text)
+        ref[f"{prefix}_un_norm"] = _map_unique(ref[f"{prefix}_un_raw"], norm_unit)
+    ref.index.name = COL_COD
+    return ref
+
+
+def _compare(m: pd.DataFrame, ref: pd.DataFrame) -> pd.DataFrame:
+    """
+    Junta as linhas de módulo (COD_SAP, desc_modulo_raw, un_modulo_raw[, modulo]) à
+    referência num único merge e calcula matches e status de forma vetorizada.
+    """
+    out = m.merge(ref, left_on=COL_COD, right_index=True, how="left")
+    arrow = _is_arrow(out[COL_COD])
+
+    out["desc_modulo_norm"] = _map_unique(out["desc_modulo_raw"], norm_text)
+    out["un_modulo_norm"] = _map_unique(out["un_modulo_raw"], norm_unit)
+
+    existe_any = np.zeros(len(out), dtype=bool)
+    ok_desc = np.zeros(len(out), dtype=bool)
+    ok_un = np.zeros(len(out), dtype=bool)
+    for _, prefix, existe, suffix in REF_BASES:
+        out[existe] = out[f"{prefix}_desc_raw"].notna()
+        # Códigos ausentes da referência ficam com norm vazio, como norm_text(NaN)
+        out[f"{prefix}_desc_norm"] = out[f"{prefix}_desc_norm"].fillna("")
+        out[f"{prefix}_un_norm"] = out[f"{prefix}_un_norm"].fillna("")
+
+        match_desc = (out["desc_modulo_norm"] != "") & (out["desc_modulo_norm"] == out[f"{prefix}_desc_norm"])
+        match_un = (out["un_modulo_norm"] != "") & (out["un_modulo_norm"] == out[f"{prefix}_un_norm"])
+        out[f"match_desc_modulo_{suffix}"] = match_desc
+        out[f"match_un_modulo_{suffix}"] = match_un
+
+        existe_any |= _np_bool(out[existe])
+        ok_desc |= _np_bool(match_desc)
+        ok_un |= _np_bool(match_un)
+
+    status_desc = np.where(~existe_any, STATUS_NAO_ENCONTRADO, np.where(ok_desc, "OK", "DIVERGENTE"))
+    status_un = np.where(~existe_any, STATUS_NAO_ENCONTRADO, np.where(ok_un, "OK", "DIVERGENTE"))
+    if arrow:
+        status_desc = _arrow_str(status_desc)
+        status_un = _arrow_str(status_un)
+    out["status_desc"] = status_desc
+    out["status_un"] = status_un
+
+    cols = ([COL_MODULO] if COL_MODULO in out.columns else []) + ANALYSIS_COLUMNS
+    return out[cols]
+
+
+def _module_rows(modulo: pd.DataFrame) -> pd.DataFrame:
+    return modulo[[COL_COD, COL_DESC, COL_UN]].rename(columns={
+        COL_DESC: "desc_modulo_raw",
+        COL_UN: "un_modulo_raw",
+    })
 
-    out["status_desc"] = out.apply(status_desc, axis=1)
-    out["status_un"] = out.apply(status_un, axis=1)
 
+def build_analysis(modulo: pd.DataFrame, sap: pd.DataFrame, orca: pd.DataFrame, caderno: pd.DataFrame) -> pd.DataFrame:
+    m = _module_rows(modulo)
+    ref = build_reference(sap, orca, caderno, codes=pd.Index(m[COL_COD].unique()))
+    out = _compare(m, ref)
     return out.sort_values([COL_COD]).reset_index(drop=True)
 
 
+def build_analysis_multi(modulos: Dict[str, pd.DataFrame], sap: pd.DataFrame,
+                         orca: pd.DataFrame, caderno: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compara N abas de módulo contra a mesma referência numa única passada.
+
+    As abas são empilhadas com a coluna 'modulo' (nome da aba), a referência é montada
+    uma vez só com os COD_SAP presentes em algum módulo e a comparação é um único
+    merge vetorizado. Colunas iguais às de build_analysis, mais 'modulo' na frente.
+    """
+    if not modulos:
+        raise ValueError("Nenhuma aba de módulo informada")
+    m = pd.concat(
+        [_module_rows(df).assign(**{COL_MODULO: name}) for name, df in modulos.items()],
+        ignore_index=True,
+    )
+    ref = build_reference(sap, orca, caderno, codes=pd.Index(m[COL_COD].unique()))
+    out = _compare(m, ref)
+    # Mantém a ordem das abas no arquivo, não a alfabética
+    order = {name: i for i, name in enumerate(modulos)}
+    out = out.assign(_ord=out[COL_MODULO].map(order))
+    return out.sort_values(["_ord", COL_COD]).drop(columns="_ord").reset_index(drop=True)
+
+
 def build_errors(analysis: pd.DataFrame) -> pd.DataFrame:
-    mask = (analysis["status_desc"] != "OK") | (analysis["status_un"] != "OK")
+    mask = _np_bool(analysis["status_desc"] != "OK") | _np_bool(analysis["status_un"] != "OK")
     err = analysis.loc[mask].copy()
 
-    def classify(row) -> str:
-        if row["status_desc"] == "NAO_ENCONTRADO_EM_NENHUMA_BASE":
-            return "NAO_ENCONTRADO"
-        flags = []
-        if row["status_desc"] == "DIVERGENTE":
-            flags.append("DESC")
-        if row["status_un"] == "DIVERGENTE":
-            flags.append("UN")
-        return "DIVERGENTE_" + "_".join(flags) if flags else "OUTRO"
-
-    err["tipo_erro"] = err.apply(classify, axis=1)
+    desc_div = _np_bool(err["status_desc"] == "DIVERGENTE")
+    un_div = _np_bool(err["status_un"] == "DIVERGENTE")
+    tipo = np.select(
+        [
+            _np_bool(err["status_desc"] == STATUS_NAO_ENCONTRADO),
+            desc_div & un_div,
+            desc_div,
+            un_div,
+        ],
+        ["NAO_ENCONTRADO", "DIVERGENTE_DESC_UN", "DIVERGENTE_DESC", "DIVERGENTE_UN"],
+        default="OUTRO",
+    )
+    err["tipo_erro"] = _arrow_str(tipo) if _is_arrow(err["status_desc"]) else tipo
     return err
 
 
@@ -286,12 +630,27 @@ def build_resumo(analysis: pd.DataFrame) -> pd.DataFrame:
         .reset_index(drop=True)
     )
 
+
+def build_resumo_multi(analysis: pd.DataFrame) -> pd.DataFrame:
+    """Resumo cruzado: uma linha por (status_desc, status_un), uma coluna por módulo e TOTAL."""
+    modulos = list(dict.fromkeys(analysis[COL_MODULO]))
+    tab = (
+        analysis.groupby(["status_desc", "status_un", COL_MODULO], dropna=False)
+        .size()
+        .unstack(COL_MODULO, fill_value=0)
+        .reindex(columns=modulos, fill_value=0)
+    )
+    tab["TOTAL"] = tab.sum(axis=1)
+    tab.columns.name = None
+    return tab.sort_values("TOTAL", ascending=False).reset_index()
+
+
 def _to_bool_series(s: pd.Series) -> pd.Series:
     """
     Converte uma coluna que pode vir como bool, número ou string (TRUE/FALSE, VERDADEIRO/FALSO)
     para booleano Python de forma robusta.
     """
-    if s.dtype == bool:
+    if pd.api.types.is_bool_dtype(s.dtype):
         return s.fillna(False)
 
     # normaliza para string
@@ -303,22 +662,42 @@ def _to_bool_series(s: pd.Series) -> pd.Series:
     return x.map(lambda v: True if v in truthy else False if v in falsy else False)
 
 
+def _format_analysis_sheet(analysis: pd.DataFrame) -> pd.DataFrame:
+    # Cópia rasa: as colunas match_* são substituídas, as demais compartilham os buffers
+    # do dataframe em memória (que continua intacto para uso posterior)
+    analysis_out = analysis.copy(deep=False)
+
+    # Converte apenas as colunas match_* que existirem
+    match_cols = [c for c in analysis_out.columns if c.startswith("match_")]
+
+    for c in match_cols:
+        b = _np_bool(_to_bool_series(analysis_out[c]))
+        analysis_out[c] = np.where(b, "CORRETO", "A VERIFICAR")
+    return analysis_out
+
+
+_RE_SHEET_INVALID = re.compile(r"[\[\]:*?/\\]")
+
+
+def _sheet_title(prefix: str, name: str, used: Set[str]) -> str:
+    """Nome de aba válido no Excel (máx. 31 caracteres, sem []:*?/\\) e único."""
+    base = _RE_SHEET_INVALID.sub("_", f"{prefix} {name}")[:31]
+    title, i = base, 2
+    while title.lower() in used:
+        suffix = f"~{i}"
+        title = base[:31 - len(suffix)] + suffix
+        i += 1
+    used.add(title.lower())
+    return title
+
+
 def export_excel(out_path: Path, analysis: pd.DataFrame, errors: pd.DataFrame, resumo: pd.DataFrame) -> None:
     """
     Exporta 3 abas e aplica um pós-processamento apenas na aba 'analysis':
     - Colunas match_*: True/VERDADEIRO -> CORRETO; demais -> A VERIFICAR
     """
     out_path.parent.mkdir(parents=True, exist_ok=True)
-
-    # Copia só para não alterar o dataframe em memória (mantém lógica/uso posterior intactos)
-    analysis_out = analysis.copy()
-
-    # Converte apenas as colunas match_* que existirem
-    match_cols = [c for c in analysis_out.columns if c.startswith("match_")]
-
-    for c in match_cols:
-        b = _to_bool_series(analysis_out[c])
-        analysis_out[c] = b.map(lambda v: "CORRETO" if v else "A VERIFICAR")
+    analysis_out = _format_analysis_sheet(analysis)
 
     with pd.ExcelWriter(out_path, engine="openpyxl") as w:
         resumo.to_excel(w, index=False, sheet_name="resumo")
@@ -326,19 +705,202 @@ def export_excel(out_path: Path, analysis: pd.DataFrame, errors: pd.DataFrame, r
         analysis_out.to_excel(w, index=False, sheet_name="analysis")
 
 
-def run_analysis_file(excel_path: Path, out_path: Path,
-                      sheet_modulo: str = SHEETS_DEFAULT["modulo"],
-                      sheet_sap: str = SHEETS_DEFAULT["sap"],
-                      sheet_orca: str = SHEETS_DEFAULT["orca"],
-                      sheet_caderno: str = SHEETS_DEFAULT["caderno"]) -> Path:
-    modulo = load_sheet(excel_path, sheet_modulo, role="modulo")
-    sap = load_sheet(excel_path, sheet_sap, role="sap")
-    orca = load_sheet(excel_path, sheet_orca, role="orca")
-    caderno = load_sheet(excel_path, sheet_caderno, role="caderno")
-
-    analysis = build_analysis(modulo, sap, orca, caderno)
+def _series_is_ok(s: pd.Series) -> pd.Series:
+    # kind "b" cobre bool do NumPy e bool[pyarrow]
+    if s.dtype.kind == "b":
+        return s.fillna(False)
+    x = s.fillna("").astype(str).str.strip().str.upper()
+    ok_values = {"TRUE", "VERDADEIRO", "CORRETO", "OK", "SIM", "1", "T", "YES"}
+    return x.isin(ok_values)
+
+
+def error_counts_and_scatter(analysis: pd.DataFrame, max_points: int = 1200) -> dict:
+    """
+    Contagens de divergência por base e pontos do scatter a partir do dataframe de análise.
+
+    Aceita as colunas match_* em bool (análise em memória, inclusive bool[pyarrow]) ou
+    como texto ("CORRETO"/"A VERIFICAR", aba lida do .xlsx). As contas são feitas em
+    arrays NumPy e só os até `max_points` pontos devolvidos viram objetos Python.
+    """
+    n = len(analysis)
+
+    def err_col(cname):
+        if cname not in analysis.columns:
+            return np.ones(n, dtype=bool)
+        return ~_series_is_ok(analysis[cname]).to_numpy(dtype=bool, na_value=False)
+
+    bases = (("SAP", "sap"), ("ORCA", "orca"), ("CADERNO", "caderno"))
+    desc_err = {k: err_col(f"match_desc_modulo_{b}") for k, b in bases}
+    un_err = {k: err_col(f"match_un_modulo_{b}") for k, b in bases}
+
+    counts = {
+        "desc": {k: int(v.sum()) for k, v in desc_err.items()},
+        "un": {k: int(v.sum()) for k, v in un_err.items()},
+        "total_rows": int(n),
+    }
+
+    x = np.sum(list(desc_err.values()), axis=0, dtype=np.int64)
+    y = np.sum(list(un_err.values()), axis=0, dtype=np.int64)
+    score = x + y
+
+    # Ordem decrescente por (score, x, y); lexsort é estável, empates mantêm a ordem original
+    order = np.lexsort((-y, -x, -score))[:max_points]
+    cods = analysis[COL_COD].iloc[order].fillna("").astype(str).tolist()
+    xs, ys, scores = x[order].tolist(), y[order].tolist(), score[order].tolist()
+
+    scatter_points = [{"x": a, "y": b, "cod": c} for a, b, c in zip(xs, ys, cods)]
+    top_criticos = [
+        {"cod": c, "x": a, "y": b, "score": sc}
+        for c, a, b, sc in zip(cods[:12], xs[:12], ys[:12], scores[:12])
+    ]
+
+    return {
+        "counts": counts,
+        "scatter": {
+            "points": scatter_points,
+            "top": top_criticos,
+            "max_points": int(max_points),
+        }
+    }
+
+
+def compute_error_counts_and_scatter(excel_path: Path, max_points: int = 1200) -> dict:
+    """Mesmo payload de error_counts_and_scatter, lendo a aba 'analysis' de um relatório salvo."""
+    df = pd.read_excel(excel_path, sheet_name="analysis", dtype=object)
+    return error_counts_and_scatter(df, max_points=max_points)
+
+
+def analyze_workbook(excel_path: Path,
+                     sheet_modulo: Optional[str] = None,
+                     sheet_sap: Optional[str] = None,
+                     sheet_orca: Optional[str] = None,
+                     sheet_caderno: Optional[str] = None,
+                     arrow: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Lê as abas e devolve (analysis, erros, resumo), sem exportar.
+
+    Abas não informadas são descobertas pelos cabeçalhos (discover_sheets), de modo que
+    abas renomeadas ou cabeçalhos errados falham antes da leitura completa e abas que
+    não interessam nunca são carregadas.
+
+    Com arrow=True as colunas de texto ficam em string[pyarrow] da leitura até o
+    resultado (requer pyarrow); os valores são os mesmos do modo padrão.
+    """
+    headers, header_rows = read_sheet_layout(excel_path)
+    sheets = discover_sheets(excel_path, {
+        "modulo": sheet_modulo,
+        "sap": sheet_sap,
+        "orca": sheet_orca,
+        "caderno": sheet_caderno,
+    }, headers=headers)
+
+    # Um único ExcelFile evita reabrir e reprocessar o .xlsx a cada aba
+    with pd.ExcelFile(excel_path, engine="openpyxl") as xls:
+        frames = {
+            role: load_sheet(xls, name, role=role, arrow=arrow, header=header_rows[name])
+            for role, name in sheets.items()
+        }
+
+    analysis = build_analysis(frames["modulo"], frames["sap"], frames["orca"], frames["caderno"])
     errors = build_errors(analysis)
     resumo = build_resumo(analysis)
+    return analysis, errors, resumo
+
 
+def run_analysis_file(excel_path: Path, out_path: Path,
+                      sheet_modulo: Optional[str] = None,
+                      sheet_sap: Optional[str] = None,
+                      sheet_orca: Optional[str] = None,
+                      sheet_caderno: Optional[str] = None,
+                      arrow: bool = False) -> Path:
+    analysis, errors, resumo = analyze_workbook(
+        excel_path,
+        sheet_modulo=sheet_modulo,
+        sheet_sap=sheet_sap,
+        sheet_orca=sheet_orca,
+        sheet_caderno=sheet_caderno,
+        arrow=arrow,
+    )
     export_excel(out_path, analysis=analysis, errors=errors, resumo=resumo)
     return out_path
+
+
+def export_excel_multi(out_path: Path, analysis: pd.DataFrame, errors: pd.DataFrame, resumo: pd.DataFrame) -> None:
+    """
+    Exporta o resumo cruzado ('resumo') e, para cada módulo, as abas 'analysis <módulo>' e
+    'erros <módulo>', com o mesmo pós-processamento das colunas match_* de export_excel.
+    """
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    used = {"resumo"}
+
+    with pd.ExcelWriter(out_path, engine="openpyxl") as w:
+        resumo.to_excel(w, index=False, sheet_name="resumo")
+        err_by_mod = dict(tuple(errors.groupby(COL_MODULO, sort=False)))
+        for name, part in analysis.groupby(COL_MODULO, sort=False):
+            err = err_by_mod.get(name, errors.iloc[0:0])
+            err.drop(columns=COL_MODULO).to_excel(
+                w, index=False, sheet_name=_sheet_title("erros", name, used))
+            _format_analysis_sheet(part.drop(columns=COL_MODULO)).to_excel(
+                w, index=False, sheet_name=_sheet_title("analysis", name, used))
+
+
+def analyze_workbook_multi(excel_path: Path,
+                           sheets_modulo: Optional[Sequence[str]] = None,
+                           sheet_sap: Optional[str] = None,
+                           sheet_orca: Optional[str] = None,
+                           sheet_caderno: Optional[str] = None,
+                           arrow: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Como analyze_workbook, mas para N abas de módulo contra as mesmas bases.
+
+    Sem sheets_modulo, todas as abas com cabeçalho de módulo que não são bases entram.
+    Devolve (analysis, erros, resumo cruzado), com a coluna 'modulo' em analysis/erros.
+    """
+    headers, header_rows = read_sheet_layout(excel_path)
+    fixed = {"sap": sheet_sap, "orca": sheet_orca, "caderno": sheet_caderno}
+    if sheets_modulo:
+        modules = list(dict.fromkeys(sheets_modulo))
+        # Valida os módulos pelo cabeçalho (antes de qualquer leitura completa) e os tira
+        # dos candidatos a base, para que nenhum deles seja escolhido como sap/orca/caderno
+        for name in modules:
+            _check_sheet_role(headers, name, "modulo")
+        clash = [name for name in fixed.values() if name in modules]
+        if clash:
+            raise ValueError(f"Abas informadas ao mesmo tempo como módulo e como base: {clash}")
+        refs = discover_sheets(excel_path, fixed, roles=["sap", "orca", "caderno"],
+                               headers={n: h for n, h in headers.items() if n not in modules})
+    else:
+        modules, refs = discover_module_sheets(excel_path, fixed, headers=headers)
+
+    with pd.ExcelFile(excel_path, engine="openpyxl") as xls:
+        modulos = {
+            name: load_sheet(xls, name, role="modulo", arrow=arrow, header=header_rows[name])
+            for name in modules
+        }
+        sap, orca, caderno = (
+            load_sheet(xls, refs[role], role=role, arrow=arrow, header=header_rows[refs[role]])
+            for role in ("sap", "orca", "caderno")
+        )
+
+    analysis = build_analysis_multi(modulos, sap, orca, caderno)
+    errors = build_errors(analysis)
+    resumo = build_resumo_multi(analysis)
+    return analysis, errors, resumo
+
+
+def run_analysis_file_multi(excel_path: Path, out_path: Path,
+                            sheets_modulo: Optional[Sequence[str]] = None,
+                            sheet_sap: Optional[str] = None,
+                            sheet_orca: Optional[str] = None,
+                            sheet_caderno: Optional[str] = None,
+                            arrow: bool = False) -> Path:
+    analysis, errors, resumo = analyze_workbook_multi(
+        excel_path,
+        sheets_modulo=sheets_modulo,
+        sheet_sap=sheet_sap,
+        sheet_orca=sheet_orca,
+        sheet_caderno=sheet_caderno,
+        arrow=arrow,
+    )
+    export_excel_multi(out_path, analysis=analysis, errors=errors, resumo=resumo)
+    return out_path
@@ -1,17 +1,25 @@
+from __future__ import annotations
+
 from pathlib import Path
 from uuid import uuid4
 import os
 from io import StringIO
 from datetime import datetime
+import math
+import numbers
 import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import TYPE_CHECKING, Dict, Optional
 
-import pandas as pd
-import google.generativeai as genai
 from flask import Flask, render_template, request, jsonify, send_file
-from werkzeug.utils import secure_filename
 
-# Importa o core existente (Módulos)
-from analyze_core import run_analysis_file
+from storage import StorageManager
+
+# Dependências pesadas (pandas, analyze_core, SDK do Gemini) são importadas no
+# primeiro uso, dentro das funções, para o boot do worker não pagar por elas.
+if TYPE_CHECKING:
+    import pandas as pd
 
 app = Flask(__name__)
 
@@ -22,6 +30,7 @@ def set_gemini_key(key):
     global GEMINI_KEY
     GEMINI_KEY = key
     try:
+        import google.generativeai as genai
         genai.configure(api_key=GEMINI_KEY)
         return True
     except Exception as e:
@@ -50,83 +59,113 @@ UPLOAD_DIR = BASE_DIR / "uploads"
 OUTPUT_DIR = BASE_DIR / "outputs"
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
-
-ALLOWED_EXT = {".xlsx", ".csv"}
-
-# ==============================================================================
-# LÓGICA EXISTENTE (MÓDULOS)
-# ==============================================================================
-
-def _series_is_ok(s: pd.Series) -> pd.Series:
-    if s.dtype == bool:
-        return s.fillna(False)
-    x = s.fillna("").astype(str).str.strip().str.upper()
-    ok_values = {"TRUE", "VERDADEIRO", "CORRETO", "OK", "SIM", "1", "T", "YES"}
-    return x.isin(ok_values)
-
-
-def compute_error_counts_and_scatter(excel_path: Path, max_points: int = 1200) -> dict:
-    df = pd.read_excel(excel_path, sheet_name="analysis", dtype=object)
-
-    def get_ok_col(cname):
-        if cname not in df.columns:
-            return pd.Series([False]*len(df), index=df.index)
-        return _series_is_ok(df[cname])
-
-    desc_sap_ok = get_ok_col("match_desc_modulo_sap")
-    desc_orca_ok = get_ok_col("match_desc_modulo_orca")
-    desc_cad_ok = get_ok_col("match_desc_modulo_caderno")
-
-    un_sap_ok = get_ok_col("match_un_modulo_sap")
-    un_orca_ok = get_ok_col("match_un_modulo_orca")
-    un_cad_ok = get_ok_col("match_un_modulo_caderno")
-
-    counts = {
-        "desc": {
-            "SAP": int((~desc_sap_ok).sum()),
-            "ORCA": int((~desc_orca_ok).sum()),
-            "CADERNO": int((~desc_cad_ok).sum()),
-        },
-        "un": {
-            "SAP": int((~un_sap_ok).sum()),
-            "ORCA": int((~un_orca_ok).sum()),
-            "CADERNO": int((~un_cad_ok).sum()),
-        },
-        "total_rows": int(len(df)),
-    }
-
-    desc_err = (~desc_sap_ok).astype(int) + (~desc_orca_ok).astype(int) + (~desc_cad_ok).astype(int)
-    un_err = (~un_sap_ok).astype(int) + (~un_orca_ok).astype(int) + (~un_cad_ok).astype(int)
-
-    scatter_df = pd.DataFrame({
-        "cod": df["COD_SAP"].fillna("").astype(str),
-        "x": desc_err.astype(int),
-        "y": un_err.astype(int),
-    })
-
-    scatter_df["score"] = scatter_df["x"] + scatter_df["y"]
-    scatter_df = scatter_df.sort_values(["score", "x", "y"], ascending=False)
-
-    if len(scatter_df) > max_points:
-        scatter_df = scatter_df.head(max_points)
-
-    scatter_points = scatter_df[["x", "y", "cod"]].to_dict(orient="records")
-    top_criticos = scatter_df.head(12)[["cod", "x", "y", "score"]].to_dict(orient="records")
-
-    return {
-        "counts": counts,
-        "scatter": {
-            "points": scatter_points,
-            "top": top_criticos,
-            "max_points": int(max_points),
-        }
-    }
+RESULTS_DB = OUTPUT_DIR / "resultados.sqlite"
+SNAPSHOT_DIR = OUTPUT_DIR / "snapshots"
+
+
+def _forget_results(tokens):
+    from result_store import delete_results
+    delete_results(RESULTS_DB, tokens)
+
+
+# Gravação no result_store fora da requisição: um único escritor (o SQLite serializa as
+# escritas de qualquer forma); /results/<token> espera a gravação pendente do token.
+# O estado fica em runs.status, visível para todos os workers; uma gravação 'gravando'
+# há mais de RESULTS_STALE_SECONDS é tratada como perdida (worker reiniciado no meio).
+RESULTS_WAIT_SECONDS = float(os.environ.get("RESULTS_WAIT_SECONDS", "30"))
+RESULTS_STALE_SECONDS = float(os.environ.get("RESULTS_STALE_SECONDS", "600"))
+_RESULTS_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-store")
+_PENDING_RESULTS: Dict[str, Future] = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def persist_results(token: str, analysis: pd.DataFrame, errors: pd.DataFrame) -> Future:
+    """Agenda save_results(RESULTS_DB, ...) no escritor em segundo plano."""
+    from result_store import fail_run, save_results, start_run
+
+    def done(fut: Future):
+        if fut.exception() is not None:
+            print(f"Erro ao gravar resultados de {token}: {fut.exception()}")
+            try:
+                fail_run(RESULTS_DB, token)
+            except Exception as e:
+                print(f"Erro ao registrar a falha de {token}: {e}")
+        with _PENDING_LOCK:
+            _PENDING_RESULTS.pop(token, None)
+
+    start_run(RESULTS_DB, token)
+    with _PENDING_LOCK:
+        fut = _RESULTS_WRITER.submit(save_results, RESULTS_DB, token, analysis, errors)
+        _PENDING_RESULTS[token] = fut
+    fut.add_done_callback(done)
+    return fut
+
+
+def flush_results(timeout: Optional[float] = None) -> None:
+    """Espera as gravações pendentes (testes de carga, desligamento)."""
+    with _PENDING_LOCK:
+        pending = list(_PENDING_RESULTS.values())
+    for fut in pending:
+        try:
+            fut.result(timeout=timeout)
+        except Exception:
+            pass
+
+
+# Retenção: TTL dos relatórios em horas, cota em GB (relatórios + snapshots + banco de
+# resultados) e snapshots mantidos por projeto (0 desativa cada limite)
+STORAGE_TTL_HOURS = float(os.environ.get("STORAGE_TTL_HOURS", "72"))
+STORAGE_MAX_GB = float(os.environ.get("STORAGE_MAX_GB", "5"))
+SNAPSHOT_KEEP = int(os.environ.get("SNAPSHOT_KEEP", "20"))
+STORAGE_JANITOR_INTERVAL = float(os.environ.get("STORAGE_JANITOR_INTERVAL", "600"))
+
+STORAGE = StorageManager(
+    reports_dir=OUTPUT_DIR / "reports",
+    uploads_dir=UPLOAD_DIR,
+    ttl_seconds=STORAGE_TTL_HOURS * 3600 or None,
+    max_bytes=int(STORAGE_MAX_GB * 1024 ** 3) or None,
+    legacy_dir=OUTPUT_DIR,
+    on_evict=_forget_results,
+    results_db=RESULTS_DB,
+    snapshots_dir=SNAPSHOT_DIR,
+    snapshot_keep=SNAPSHOT_KEEP or None,
+)
+STORAGE_JANITOR = os.environ.get("STORAGE_JANITOR", "1") != "0"
+_JANITOR_STARTED = False
+
+
+@app.before_request
+def _start_janitor():
+    # Só quando o app atende requisições: importar app.py (benchmarks, scripts) não
+    # varre outputs/ nem paga a varredura no boot do worker
+    global _JANITOR_STARTED
+    if STORAGE_JANITOR and not _JANITOR_STARTED:
+        _JANITOR_STARTED = True
+        STORAGE.start_janitor(STORAGE_JANITOR_INTERVAL)
+
+# "arrow" mantém as colunas de texto em string[pyarrow] durante a análise (requer pyarrow)
+ANALYSIS_ENGINE = os.environ.get("ANALYSIS_ENGINE", "pandas")
+
+ALLOWED_EXT = {".xlsx", ".xlsm", ".csv"}
+
+
+def upload_suffix(filename: Optional[str]) -> str:
+    """
+    Extensão do nome original do upload, se conhecida ("" caso contrário).
+
+    Vem do nome bruto: secure_filename descarta trechos não ASCII e transforma
+    '関数.xlsx' em 'xlsx', sem extensão.
+    """
+    ext = Path(filename or "").suffix.lower()
+    return ext if ext in ALLOWED_EXT else ""
 
 # ==============================================================================
 # LÓGICA DE IA (GERAL)
 # ==============================================================================
 
 def parse_csv_to_charts(csv_text: str) -> list:
+    import pandas as pd
+
     charts = {}
     try:
         # 1. Limpeza: Remove blocos ```csv e ``` e espaços extras
@@ -206,7 +245,12 @@ def generate_ai_analysis_modules(analysis_df: pd.DataFrame, errors_df: pd.DataFr
 # ==============================================================================
 
 def clean_currency(val):
-    if pd.isna(val) or str(val).strip() == "": return 0.0
+    import pandas as pd  # já carregado por quem chama (.apply): só uma consulta a sys.modules
+
+    # Nulos do pandas (NA/NaT) e NaN de qualquer float, inclusive numpy
+    if val is None or val is pd.NA or val is pd.NaT: return 0.0
+    if isinstance(val, numbers.Real) and math.isnan(val): return 0.0
+    if str(val).strip() == "": return 0.0
     if isinstance(val, (int, float)): return float(val)
     
     # Remove R$ e espaços
@@ -227,6 +271,8 @@ def clean_currency(val):
         return 0.0
 
 def generate_contract_ai_analysis(df: pd.DataFrame) -> list:
+    import pandas as pd
+
     # Normaliza headers
     df.columns = [str(c).strip() for c in df.columns]
     
@@ -293,6 +339,7 @@ def call_gemini(prompt):
     if not GEMINI_KEY:
         return [{"error": "Chave Gemini não configurada. Informe a chave na tela."}]
     try:
+        import google.generativeai as genai
         genai.configure(api_key=GEMINI_KEY)
     except Exception as e:
         return [{"error": f"Erro ao configurar Gemini: {e}"}]
@@ -316,57 +363,71 @@ def index():
 
 @app.post("/analyze-json")
 def analyze_modules():
+    from analyze_core import analyze_workbook, error_counts_and_scatter, export_excel
+    from snapshot_store import project_slug, save_snapshot
+
     if "file" not in request.files: return jsonify({"error":"Sem arquivo"}), 400
     f = request.files["file"]
     if not f: return jsonify({"error":"Sem arquivo"}), 400
     
-    fname = secure_filename(f.filename)
+    ext = upload_suffix(f.filename)
     token = uuid4().hex
-    in_path = UPLOAD_DIR / f"{token}_{fname}"
-    f.save(in_path)
-    out_path = OUTPUT_DIR / f"comparacao_{token}.xlsx"
 
     try:
-        run_analysis_file(in_path, out_path)
-        payload = compute_error_counts_and_scatter(out_path)
+        # O upload só existe em disco enquanto as abas são lidas
+        with STORAGE.temp_upload(f, suffix=ext) as in_path:
+            analysis, errors, resumo = analyze_workbook(in_path, arrow=ANALYSIS_ENGINE == "arrow")
+        out_path = STORAGE.report_path(token)
+        export_excel(out_path, analysis=analysis, errors=errors, resumo=resumo)
+        persist_results(token, analysis, errors)
+        # Snapshot/delta só quando o cliente identifica o projeto: uploads anônimos não
+        # são comparados entre si
+        project = None
+        if (request.form.get("project") or "").strip():
+            project = project_slug(request.form.get("project"))
+            save_snapshot(SNAPSHOT_DIR, project, token, analysis, errors)
+        # Payload e IA usam os dataframes em memória, sem reler o relatório gerado
+        payload = error_counts_and_scatter(analysis)
         
         ai_charts = []
         try:
-            dfa = pd.read_excel(out_path, sheet_name="analysis", dtype=object)
-            try: dfe = pd.read_excel(out_path, sheet_name="erros", dtype=object)
-            except: dfe = pd.DataFrame()
-            ai_charts = generate_ai_analysis_modules(dfa, dfe)
+            ai_charts = generate_ai_analysis_modules(analysis, errors)
         except: ai_charts = [{"error": "Erro IA"}]
 
-        return jsonify({
+        resp = {
             "ok": True, 
             "type": "modules",
             "counts": payload["counts"], 
             "download_url": f"/download/{token}",
+            "results_url": f"/results/{token}",
             "ai_charts": ai_charts
-        })
+        }
+        if project:
+            resp["project"] = project
+            resp["delta_url"] = f"/projects/{project}/delta"
+        return jsonify(resp)
     except Exception as e:
         return jsonify({"ok":False, "error":str(e)}), 400
 
 @app.post("/analyze-contracts")
 def analyze_contracts():
+    import pandas as pd
+
     if "file" not in request.files: return jsonify({"error":"Sem arquivo"}), 400
     f = request.files["file"]
     if not f: return jsonify({"error":"Sem arquivo"}), 400
     
-    fname = secure_filename(f.filename)
-    token = uuid4().hex
-    in_path = UPLOAD_DIR / f"contrato_{token}_{fname}"
-    f.save(in_path)
+    ext = upload_suffix(f.filename)
 
     try:
-        # Lê Excel ou CSV
-        if fname.lower().endswith('.csv'):
-            try: df = pd.read_csv(in_path, sep=',')
-            except: df = pd.read_csv(in_path, sep=';', on_bad_lines='skip')
-        else:
-            df = pd.read_excel(in_path)
-            
+        # Lê Excel ou CSV; o temporário é apagado logo após o parse
+        with STORAGE.temp_upload(f, suffix=ext) as in_path:
+            if ext == '.csv':
+                try: df = pd.read_csv(in_path, sep=',')
+                except: df = pd.read_csv(in_path, sep=';', on_bad_lines='skip')
+            else:
+                df = pd.read_excel(in_path)
+
         ai_charts = generate_contract_ai_analysis(df)
         
         return jsonify({
@@ -377,10 +438,96 @@ def analyze_contracts():
     except Exception as e:
         return jsonify({"ok":False, "error":f"Erro contratos: {e}"}), 400
 
+@app.get("/results/<token>")
+def results(token: str):
+    """
+    Consulta filtrada/paginada da análise gravada no result_store.
+
+    Query string: view (erros|analysis), tipo_erro, status_desc, status_un (CSV de valores),
+    base (sap|orca|caderno), cod_prefix, sort, order, page, page_size.
+    """
+    from result_store import RUN_FAILED, RUN_WRITING, query_results, run_status
+
+    with _PENDING_LOCK:
+        pending = _PENDING_RESULTS.get(token)
+    if pending is not None:
+        try:
+            pending.result(timeout=RESULTS_WAIT_SECONDS)
+        except FutureTimeout:
+            return jsonify({"ok": False, "status": "processando",
+                            "error": "Resultados ainda sendo gravados, tente novamente"}), 202
+        except Exception:
+            pass  # a falha já foi registrada em runs.status; tratada abaixo
+
+    args = request.args
+    try:
+        data = query_results(
+            RESULTS_DB, token,
+            view=args.get("view", "erros"),
+            tipo_erro=args.get("tipo_erro"),
+            status_desc=args.get("status_desc"),
+            status_un=args.get("status_un"),
+            base=args.get("base"),
+            cod_prefix=args.get("cod_prefix"),
+            sort=args.get("sort", "cod_sap"),
+            order=args.get("order", "asc"),
+            page=args.get("page", 1, type=int),
+            page_size=args.get("page_size", 100, type=int),
+            with_total=args.get("total", "1") != "0",
+        )
+    except LookupError as e:
+        run = run_status(RESULTS_DB, token)
+        status = run["status"] if run else None
+        if status == RUN_WRITING:
+            age = (datetime.now() - datetime.fromisoformat(run["created_at"])).total_seconds()
+            if age <= RESULTS_STALE_SECONDS:
+                # Agendada por outro worker e ainda não concluída
+                return jsonify({"ok": False, "status": "processando",
+                                "error": "Resultados ainda sendo gravados, tente novamente"}), 202
+            status = RUN_FAILED
+        if status == RUN_FAILED:
+            return jsonify({"ok": False, "status": "falhou",
+                            "error": f"Falha ao gravar os resultados do token {token}"}), 500
+        return jsonify({"ok": False, "error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"ok": True, **data})
+
+@app.get("/projects/<project>/snapshots")
+def project_snapshots(project: str):
+    from snapshot_store import list_snapshots, project_slug
+
+    snaps = [{"token": s["token"], "created_at": s["created_at"]}
+             for s in list_snapshots(SNAPSHOT_DIR, project)]
+    return jsonify({"ok": True, "project": project_slug(project), "snapshots": snaps})
+
+@app.get("/projects/<project>/delta")
+def project_delta(project: str):
+    """
+    Divergências novas, resolvidas, alteradas e removidas entre duas execuções do projeto.
+    Query string: from, to (tokens; padrão = penúltima e última execução), limit.
+    """
+    from snapshot_store import delta_between
+
+    try:
+        data = delta_between(
+            SNAPSHOT_DIR, project,
+            from_token=request.args.get("from"),
+            to_token=request.args.get("to"),
+            limit=request.args.get("limit", 1000, type=int),
+        )
+    except LookupError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    return jsonify({"ok": True, **data})
+
+@app.get("/storage/stats")
+def storage_stats():
+    return jsonify({"ok": True, **STORAGE.usage()})
+
 @app.get("/download/<token>")
 def download(token: str):
-    p = OUTPUT_DIR / f"comparacao_{token}.xlsx"
-    if not p.exists(): return "404", 404
+    p = STORAGE.find_report(token)
+    if p is None: return "404", 404
     return send_file(p, as_attachment=True, download_name="comparacao.xlsx")
 
 if __name__ == "__main__":
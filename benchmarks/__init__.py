@@ -0,0 +1,6 @@
+"""
+Benchmarks do pipeline de análise (gerador de planilhas sintéticas e medição por etapa).
+
+Uso:
+    python -m benchmarks.pipeline --rows 1000 10000 100000
+"""
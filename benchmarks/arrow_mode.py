@@ -0,0 +1,175 @@
+"""
+Compara o modo padrão (dtypes de texto padrão do pandas) com o modo arrow
+(string[pyarrow] do início ao fim) do pipeline de módulos.
+
+As abas vêm de generate_rows direto para DataFrames (dtype=object, como o read_excel),
+então a leitura do .xlsx, igual nos dois modos, fica fora da medição. Para cada modo são
+medidos prepare_sheet, build_analysis, build_errors, _format_analysis_sheet e o payload
+JSON (error_counts_and_scatter): tempo, bytes que a etapa deixa alocados no pool de
+memória do Arrow, tamanho final do dataframe de análise e, com --trace-memory, o pico
+do tracemalloc (alocações Python/NumPy; deixa as etapas bem mais lentas).
+
+Exemplos:
+    python -m benchmarks.arrow_mode --rows 100000
+    python -m benchmarks.arrow_mode --rows 100000 1000000 --repeat 1 --trace-memory
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from analyze_core import (
+    COL_COD,
+    COL_DESC,
+    COL_UN,
+    _format_analysis_sheet,
+    build_analysis,
+    build_errors,
+    error_counts_and_scatter,
+    prepare_sheet,
+)
+from benchmarks.synthetic import generate_rows
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_OUTPUT = BENCH_DIR / "arrow_mode.json"
+
+MODES = {"padrao": False, "arrow": True}
+
+STAGES = ["prepare_sheet", "build_analysis", "build_errors", "format_analysis_sheet", "payload"]
+
+
+def raw_frames(rows: int, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """Abas sintéticas como o read_excel(dtype=object) as entregaria."""
+    data = generate_rows(rows, seed=seed)
+    return {
+        role: pd.DataFrame(items, columns=[COL_COD, COL_DESC, COL_UN], dtype=object)
+        for role, items in data.items()
+    }
+
+
+def _pool():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    return pa.default_memory_pool()
+
+
+def _measure(fn, trace_memory: bool = False):
+    """(resultado, segundos, pico do tracemalloc em MB ou None, MB retidos no pool do Arrow)."""
+    pool = _pool()
+    arrow_before = pool.bytes_allocated()
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    res = fn()
+    dt = time.perf_counter() - t0
+    py_peak = None
+    if trace_memory:
+        py_peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    # max_memory() do pool é acumulado no processo; o que a etapa retém é comparável entre modos
+    arrow_retained = pool.bytes_allocated() - arrow_before
+    return res, dt, py_peak, arrow_retained / 1024 ** 2
+
+
+def run_mode(frames: Dict[str, pd.DataFrame], arrow: bool,
+             trace_memory: bool = False) -> Dict[str, dict]:
+    """Executa as etapas num modo e devolve as métricas de cada uma."""
+    out: Dict[str, dict] = {}
+
+    def record(stage, fn):
+        res, dt, py_peak, arrow_retained = _measure(fn, trace_memory)
+        out[stage] = {"time_s": dt, "tracemalloc_peak_mb": py_peak, "arrow_retained_mb": arrow_retained}
+        return res
+
+    prepared = record("prepare_sheet", lambda: {
+        role: prepare_sheet(df, sheet_name=role, role=role, arrow=arrow) for role, df in frames.items()
+    })
+    analysis = record("build_analysis", lambda: build_analysis(
+        prepared["modulo"], prepared["sap"], prepared["orca"], prepared["caderno"]))
+    record("build_errors", lambda: build_errors(analysis))
+    record("format_analysis_sheet", lambda: _format_analysis_sheet(analysis))
+    record("payload", lambda: error_counts_and_scatter(analysis))
+
+    out["analysis_frame"] = {"memory_mb": analysis.memory_usage(deep=True).sum() / 1024 ** 2}
+    return out
+
+
+def run_benchmark(rows_list: List[int], repeat: int = 3, seed: int = 0,
+                  trace_memory: bool = False) -> dict:
+    import pyarrow as pa
+
+    results = {
+        "meta": {
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+            "arrow_pool": _pool().backend_name,
+            "repeat": repeat,
+            "seed": seed,
+            "trace_memory": trace_memory,
+        },
+        "runs": {},
+    }
+
+    for rows in rows_list:
+        frames = raw_frames(rows, seed=seed)
+        results["runs"][str(rows)] = {}
+        for mode, arrow in MODES.items():
+            samples = [run_mode(frames, arrow, trace_memory) for _ in range(repeat)]
+            agg = {
+                stage: {
+                    k: None if samples[0][stage][k] is None
+                    else statistics.median(s[stage][k] for s in samples)
+                    for k in samples[0][stage]
+                }
+                for stage in STAGES
+            }
+            agg["analysis_frame"] = samples[-1]["analysis_frame"]
+            results["runs"][str(rows)][mode] = agg
+
+        print(f"[{rows} linhas] mediana de {repeat} execução(ões)")
+        print(f"  {'etapa':<24}" + "".join(f"{m:>32}" for m in MODES))
+        print(f"  {'':<24}" + f"{'tempo  py_pico  arrow_retido':>32}" * len(MODES))
+        for stage in STAGES:
+            cells = []
+            for mode in MODES:
+                m = results["runs"][str(rows)][mode][stage]
+                py = "-" if m["tracemalloc_peak_mb"] is None else f"{m['tracemalloc_peak_mb']:.1f}MB"
+                cells.append(f"{m['time_s']:.3f}s {py:>8} {m['arrow_retained_mb']:>10.1f}MB")
+            print(f"  {stage:<24}" + "".join(f"{c:>32}" for c in cells))
+        mem = [results["runs"][str(rows)][mode]["analysis_frame"]["memory_mb"] for mode in MODES]
+        print(f"  {'analysis (deep)':<24}" + "".join(f"{v:>30.1f}MB" for v in mem))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Modo padrão x modo arrow (string[pyarrow]) do pipeline")
+    ap.add_argument("--rows", type=int, nargs="+", default=[100000])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--trace-memory", action="store_true",
+                    help="mede o pico de alocações com tracemalloc (mais lento)")
+    ap.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    args = ap.parse_args(argv)
+
+    if _pool() is None:
+        print("pyarrow não está instalado; o modo arrow não pode ser medido.")
+        return 1
+
+    results = run_benchmark(args.rows, repeat=args.repeat, seed=args.seed,
+                            trace_memory=args.trace_memory)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Benchmark do tempo de import (cold start) dos módulos do app.
+
+Cada medição roda em um interpretador novo, para que nada venha do cache de
+sys.modules. Além do tempo, informa quais dependências pesadas foram carregadas
+durante o import (o SDK do Gemini e o pandas devem ficar fora até o primeiro uso).
+
+Exemplo:
+    python -m benchmarks.import_time --modules app analyze_core --repeat 7
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["google.generativeai", "pandas", "numpy", "openpyxl", "flask"]
+
+_PROBE = """
+import sys, time, json, warnings
+warnings.simplefilter("ignore")
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+print(json.dumps({{"seconds": dt, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int = 5) -> dict:
+    """Importa `module` em `repeat` processos novos e devolve mediana/mínimo e módulos carregados."""
+    samples = []
+    loaded: List[str] = []
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True)
+        data = json.loads(proc.stdout.strip().splitlines()[-1])
+        samples.append(data["seconds"])
+        loaded = data["loaded"]
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "samples_s": samples,
+        "heavy_loaded": loaded,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Tempo de import (cold start) dos módulos do app")
+    ap.add_argument("--modules", nargs="+", default=["app", "analyze_core", "ai_service"])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--output", type=Path, default=None, help="grava o resultado em JSON")
+    args = ap.parse_args(argv)
+
+    results = {}
+    for module in args.modules:
+        r = results[module] = measure(module, repeat=args.repeat)
+        heavy = ", ".join(r["heavy_loaded"]) or "-"
+        print(f"{module:<14} mediana={r['median_s'] * 1000:8.1f}ms  min={r['min_s'] * 1000:8.1f}ms  "
+              f"carregou: {heavy}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Teste de carga ponta a ponta dos endpoints Flask, sem acesso ao Gemini.
+
+Dirige o app pela interface WSGI (test_client do Flask, um cliente por thread) com
+concorrência e tamanhos de arquivo configuráveis. O `call_gemini` do app é trocado por
+um stub local com latência configurável, e uploads/relatórios vão para um diretório
+temporário. Para cada endpoint são reportados p50/p95/p99 de latência, throughput e
+memória (RSS e, opcionalmente, pico do tracemalloc).
+
+Exemplos:
+    python -m benchmarks.loadtest --concurrency 1 4 8 --requests 32 --rows 1000
+    python -m benchmarks.loadtest --endpoints analyze-contracts --contract-rows 50000 --gemini-latency 2.0
+"""
+import argparse
+import json
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional
+
+from benchmarks.synthetic import generate_contracts_csv, generate_workbook
+from storage import StorageManager
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_CACHE_DIR = BENCH_DIR / ".cache"
+DEFAULT_OUTPUT = BENCH_DIR / "loadtest.json"
+
+ENDPOINTS = {
+    "analyze-json": "/analyze-json",
+    "analyze-contracts": "/analyze-contracts",
+}
+
+STUB_CHARTS = [
+    {"title": "Erros por Tipo", "type": "pie", "labels": ["Erro Unidade", "Erro Descrição"], "data": [15, 10]},
+]
+
+
+def make_gemini_stub(latency_s: float = 0.5):
+    """Substituto de app.call_gemini: dorme `latency_s` e devolve um gráfico fixo."""
+    calls = {"n": 0}
+    lock = threading.Lock()
+
+    def call_gemini(prompt):
+        with lock:
+            calls["n"] += 1
+        time.sleep(latency_s)
+        return [dict(c) for c in STUB_CHARTS]
+
+    call_gemini.calls = calls
+    return call_gemini
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil com interpolação linear (mesmo critério do numpy 'linear')."""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def _rss_mb() -> float:
+    """RSS atual do processo em MB (Linux via /proc; nos demais, o pico do getrusage)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def _payload_for(endpoint: str, rows: int, contract_rows: int, cache_dir: Path, seed: int):
+    if endpoint == "analyze-json":
+        path = cache_dir / f"loadtest_modulos_{rows}_s{seed}.xlsx"
+        if not path.exists():
+            generate_workbook(path, rows, seed=seed)
+        return path.read_bytes(), "modulos.xlsx"
+    path = cache_dir / f"loadtest_contratos_{contract_rows}_s{seed}.csv"
+    if not path.exists():
+        generate_contracts_csv(path, contract_rows, seed=seed)
+    return path.read_bytes(), "contratos.csv"
+
+
+def run_endpoint(flask_app, url: str, body: bytes, filename: str,
+                 concurrency: int, total_requests: int, trace_memory: bool = False) -> dict:
+    """Dispara `total_requests` uploads com `concurrency` threads e agrega as métricas."""
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(_):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        t0 = time.perf_counter()
+        resp = client.post(url, data={"file": (BytesIO(body), filename)},
+                           content_type="multipart/form-data")
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+            if resp.status_code != 200:
+                errors.append(f"{resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+
+    rss_before = _rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(one, range(total_requests)))
+    wall = time.perf_counter() - t0
+
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+        tracemalloc.stop()
+    rss_after = _rss_mb()
+
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_s": wall,
+        "throughput_rps": total_requests / wall if wall else 0.0,
+        "latency_s": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else 0.0,
+        },
+        "memory_mb": {
+            "rss_before": rss_before,
+            "rss_after": rss_after,
+            "rss_delta": rss_after - rss_before,
+            "tracemalloc_peak": traced_peak,
+        },
+        "upload_bytes": len(body),
+    }
+
+
+def run_loadtest(endpoints: List[str], concurrency_levels: List[int], total_requests: int,
+                 rows: int = 1000, contract_rows: int = 1000, gemini_latency: float = 0.5,
+                 trace_memory: bool = False, seed: int = 0,
+                 cache_dir: Path = DEFAULT_CACHE_DIR) -> dict:
+    import app as app_module
+
+    stub = make_gemini_stub(gemini_latency)
+    original = {
+        "call_gemini": app_module.call_gemini,
+        "STORAGE": app_module.STORAGE,
+        "RESULTS_DB": app_module.RESULTS_DB,
+        "SNAPSHOT_DIR": app_module.SNAPSHOT_DIR,
+        "STORAGE_JANITOR": app_module.STORAGE_JANITOR,
+    }
+
+    results = {
+        "meta": {
+            "gemini_latency_s": gemini_latency,
+            "rows": rows,
+            "contract_rows": contract_rows,
+            "requests_per_level": total_requests,
+            "trace_memory": trace_memory,
+        },
+        "endpoints": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.call_gemini = stub
+        out_dir = Path(tmp) / "outputs"
+        app_module.STORAGE = StorageManager(reports_dir=out_dir / "reports",
+                                            uploads_dir=Path(tmp) / "uploads")
+        app_module.RESULTS_DB = out_dir / "resultados.sqlite"
+        app_module.SNAPSHOT_DIR = out_dir / "snapshots"
+        app_module.STORAGE_JANITOR = False
+        try:
+            for name in endpoints:
+                body, filename = _payload_for(name, rows, contract_rows, cache_dir, seed)
+                results["endpoints"][name] = []
+                for c in concurrency_levels:
+                    r = run_endpoint(app_module.app, ENDPOINTS[name], body, filename,
+                                     concurrency=c, total_requests=total_requests,
+                                     trace_memory=trace_memory)
+                    results["endpoints"][name].append(r)
+                    lat = r["latency_s"]
+                    print(f"{name:<18} c={c:<3} n={r['requests']:<4} err={r['errors']:<3} "
+                          f"p50={lat['p50']:.3f}s p95={lat['p95']:.3f}s p99={lat['p99']:.3f}s "
+                          f"rps={r['throughput_rps']:.2f} rss={r['memory_mb']['rss_after']:.0f}MB"
+                          f"(+{r['memory_mb']['rss_delta']:.0f})")
+        finally:
+            # Gravações do result_store pendentes ainda apontam para o diretório temporário
+            app_module.flush_results()
+            for k, v in original.items():
+                setattr(app_module, k, v)
+
+    results["meta"]["gemini_calls"] = stub.calls["n"]
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Teste de carga dos endpoints Flask com Gemini simulado")
+    ap.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--requests", type=int, default=16, help="requisições por nível de concorrência")
+    ap.add_argument("--rows", type=int, default=1000, help="linhas da planilha de módulos")
+    ap.add_argument("--contract-rows", type=int, default=1000, help="linhas do CSV de contratos")
+    ap.add_argument("--gemini-latency", type=float, default=0.5, help="latência do stub do Gemini (s)")
+    ap.add_argument("--trace-memory", action="store_true",
+                    help="mede o pico de alocações com tracemalloc (mais lento)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR)
+    ap.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    args = ap.parse_args(argv)
+
+    results = run_loadtest(args.endpoints, args.concurrency, args.requests,
+                           rows=args.rows, contract_rows=args.contract_rows,
+                           gemini_latency=args.gemini_latency, trace_memory=args.trace_memory,
+                           seed=args.seed, cache_dir=args.cache_dir)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Resultados gravados em {args.output}")
+
+    failed = sum(r["errors"] for runs in results["endpoints"].values() for r in runs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
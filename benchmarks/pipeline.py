@@ -0,0 +1,230 @@
+"""
+Benchmark reprodutível do pipeline de módulos, etapa por etapa.
+
+Para cada tamanho em --rows gera (ou reaproveita) uma planilha sintética e mede
+separadamente discover_sheets, load_sheet, build_analysis, build_errors, build_resumo,
+export_excel e compute_error_counts_and_scatter. O resultado é gravado em JSON e comparado com um
+baseline salvo; etapas mais lentas que baseline * (1 + threshold) são sinalizadas.
+
+Exemplos:
+    python -m benchmarks.pipeline --rows 1000 10000 --save-baseline
+    python -m benchmarks.pipeline --rows 1000 10000 --threshold 0.25
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from analyze_core import (
+    build_analysis,
+    build_errors,
+    build_resumo,
+    compute_error_counts_and_scatter,
+    discover_sheets,
+    export_excel,
+    load_sheet,
+    read_sheet_layout,
+)
+from benchmarks.synthetic import generate_workbook
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_CACHE_DIR = BENCH_DIR / ".cache"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_OUTPUT = BENCH_DIR / "results.json"
+
+STAGES = [
+    "discover_sheets",
+    "load_sheet",
+    "build_analysis",
+    "build_errors",
+    "build_resumo",
+    "export_excel",
+    "compute_error_counts_and_scatter",
+]
+
+
+def _timed(fn: Callable[[], object]):
+    t0 = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - t0
+
+
+def workbook_for(rows: int, cache_dir: Path, seed: int = 0, **gen_kwargs) -> Path:
+    """Retorna a planilha sintética para `rows`, gerando-a só se ainda não existir no cache."""
+    suffix = "_".join(f"{k}{v}" for k, v in sorted(gen_kwargs.items()))
+    name = f"synthetic_{rows}_s{seed}{'_' + suffix if suffix else ''}.xlsx"
+    path = cache_dir / name
+    if not path.exists():
+        generate_workbook(path, rows, seed=seed, **gen_kwargs)
+    return path
+
+
+def run_once(excel_path: Path, work_dir: Path) -> Dict[str, float]:
+    """Executa o pipeline completo uma vez e devolve os segundos gastos em cada etapa."""
+    timings: Dict[str, float] = {}
+
+    def discover():
+        headers, header_rows = read_sheet_layout(excel_path)
+        return discover_sheets(excel_path, headers=headers), header_rows
+
+    (sheets, header_rows), timings["discover_sheets"] = _timed(discover)
+
+    def load_all():
+        with pd.ExcelFile(excel_path, engine="openpyxl") as xls:
+            return {role: load_sheet(xls, name, role=role, header=header_rows[name])
+                    for role, name in sheets.items()}
+
+    frames, timings["load_sheet"] = _timed(load_all)
+
+    analysis, timings["build_analysis"] = _timed(
+        lambda: build_analysis(frames["modulo"], frames["sap"], frames["orca"], frames["caderno"])
+    )
+    errors, timings["build_errors"] = _timed(lambda: build_errors(analysis))
+    resumo, timings["build_resumo"] = _timed(lambda: build_resumo(analysis))
+
+    out_path = work_dir / "comparacao_bench.xlsx"
+    _, timings["export_excel"] = _timed(
+        lambda: export_excel(out_path, analysis=analysis, errors=errors, resumo=resumo)
+    )
+    _, timings["compute_error_counts_and_scatter"] = _timed(
+        lambda: compute_error_counts_and_scatter(out_path)
+    )
+    return timings
+
+
+def run_benchmark(rows_list: List[int], repeat: int = 3, seed: int = 0,
+                  cache_dir: Path = DEFAULT_CACHE_DIR, **gen_kwargs) -> dict:
+    """Mede cada tamanho `repeat` vezes e guarda a mediana e o mínimo de cada etapa."""
+    results = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+            "generator": gen_kwargs,
+        },
+        "runs": {},
+    }
+
+    for rows in rows_list:
+        excel_path = workbook_for(rows, cache_dir, seed=seed, **gen_kwargs)
+        samples: Dict[str, List[float]] = {s: [] for s in STAGES}
+        with tempfile.TemporaryDirectory() as tmp:
+            for _ in range(repeat):
+                for stage, dt in run_once(excel_path, Path(tmp)).items():
+                    samples[stage].append(dt)
+
+        results["runs"][str(rows)] = {
+            stage: {
+                "median_s": statistics.median(vals),
+                "min_s": min(vals),
+                "samples_s": vals,
+            }
+            for stage, vals in samples.items()
+        }
+        total = sum(v["median_s"] for v in results["runs"][str(rows)].values())
+        print(f"[{rows} linhas] total(mediana)={total:.3f}s")
+        for stage in STAGES:
+            print(f"  {stage:<34} {results['runs'][str(rows)][stage]['median_s']:.4f}s")
+
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float = 0.2,
+                        min_delta_s: float = 0.005) -> List[dict]:
+    """
+    Lista as etapas cuja mediana ficou acima de baseline * (1 + threshold).
+
+    min_delta_s ignora variações absolutas muito pequenas (ruído em etapas de ms).
+    """
+    regressions = []
+    for rows, stages in results.get("runs", {}).items():
+        base_stages = baseline.get("runs", {}).get(rows)
+        if not base_stages:
+            continue
+        for stage, cur in stages.items():
+            base = base_stages.get(stage)
+            if not base:
+                continue
+            cur_s, base_s = cur["median_s"], base["median_s"]
+            if cur_s > base_s * (1 + threshold) and (cur_s - base_s) > min_delta_s:
+                regressions.append({
+                    "rows": int(rows),
+                    "stage": stage,
+                    "baseline_s": base_s,
+                    "current_s": cur_s,
+                    "ratio": cur_s / base_s if base_s else float("inf"),
+                })
+    return regressions
+
+
+def _load_json(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark por etapa do pipeline de módulos")
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 10000],
+                    help="tamanhos (linhas da aba de módulo), de 1k a 1M")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--divergence-rate", type=float, default=0.1)
+    ap.add_argument("--duplicate-rate", type=float, default=0.02)
+    ap.add_argument("--missing-rate", type=float, default=0.05)
+    ap.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR)
+    ap.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument("--threshold", type=float, default=0.2,
+                    help="regressão = mediana acima de baseline * (1 + threshold)")
+    ap.add_argument("--save-baseline", action="store_true",
+                    help="grava o resultado atual como novo baseline")
+    args = ap.parse_args(argv)
+
+    gen_kwargs = {
+        "divergence_rate": args.divergence_rate,
+        "duplicate_rate": args.duplicate_rate,
+        "missing_rate": args.missing_rate,
+    }
+    results = run_benchmark(args.rows, repeat=args.repeat, seed=args.seed,
+                            cache_dir=args.cache_dir, **gen_kwargs)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Resultados gravados em {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Baseline atualizado em {args.baseline}")
+        return 0
+
+    baseline = _load_json(args.baseline)
+    if baseline is None:
+        print(f"Sem baseline em {args.baseline}; use --save-baseline para criar.")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, threshold=args.threshold)
+    if not regressions:
+        print("Nenhuma regressão em relação ao baseline.")
+        return 0
+
+    print("REGRESSÕES:")
+    for r in regressions:
+        print(f"  [{r['rows']} linhas] {r['stage']}: {r['baseline_s']:.4f}s -> "
+              f"{r['current_s']:.4f}s (x{r['ratio']:.2f})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Gerador de planilhas sintéticas no formato esperado por analyze_core.
+
+Gera as quatro abas de SHEETS_DEFAULT com cabeçalhos sorteados entre as variantes
+de ROLE_ALIASES, descrições acentuadas, grafias de unidade do UNIT_MAP e taxas
+controláveis de divergência, duplicidade e códigos ausentes nas bases.
+"""
+import csv
+import random
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from openpyxl import Workbook
+
+from analyze_core import COL_COD, COL_DESC, COL_UN, ROLE_ALIASES, SHEETS_DEFAULT, UNIT_MAP
+
+MATERIAIS = [
+    "CABO", "CONECTOR", "ISOLADOR", "PARAFUSO", "ARRUELA", "ELETRODUTO", "CAIXA DE PASSAGEM",
+    "DISJUNTOR", "CHAVE SECCIONADORA", "TRANSFORMADOR", "PÁRA-RAIOS", "TERMINAL", "CRUZETA",
+    "POSTE", "HASTE DE ATERRAMENTO", "LUVA", "ABRAÇADEIRA", "MÃO FRANCESA", "CONCRETO", "BRITA",
+]
+QUALIFICADORES = [
+    "DE COBRE", "DE ALUMÍNIO", "GALVANIZADO", "EM AÇO INOXIDÁVEL", "DE PORCELANA", "POLIMÉRICO",
+    "PARA MÉDIA TENSÃO", "PARA BAIXA TENSÃO", "SEM REVESTIMENTO", "COM PROTEÇÃO", "TRIFÁSICO",
+    "MONOFÁSICO", "ISOLAÇÃO 0,6/1KV", "CLASSE 15KV", "REFORÇADO",
+]
+MEDIDAS = ["10MM²", "16MM²", "25MM²", "35MM²", "1/2\"", "3/4\"", "1\"", "M16", "M20", "300KVA", "9M", "11M"]
+
+
+def _unit_spellings() -> Dict[str, List[str]]:
+    """Agrupa as grafias do UNIT_MAP pela unidade canônica (ex.: PC -> PEÇA, PCA, PÇ...)."""
+    out: Dict[str, List[str]] = {}
+    for spelling, canon in UNIT_MAP.items():
+        out.setdefault(canon, []).append(spelling)
+    return out
+
+
+UNIT_SPELLINGS = _unit_spellings()
+
+
+def _headers(rng: random.Random, role: str, header_variants: bool) -> List[str]:
+    aliases = ROLE_ALIASES[role]
+    cols = [COL_COD, COL_DESC, COL_UN]
+    if not header_variants:
+        return [aliases[c][0] for c in cols]
+    return [rng.choice(aliases[c]) for c in cols]
+
+
+def _make_item(rng: random.Random) -> Tuple[str, str]:
+    desc = f"{rng.choice(MATERIAIS)} {rng.choice(QUALIFICADORES)} {rng.choice(MEDIDAS)}"
+    return desc, rng.choice(sorted(UNIT_SPELLINGS))
+
+
+def _spell_unit(rng: random.Random, canon: str) -> str:
+    return rng.choice(UNIT_SPELLINGS[canon])
+
+
+def _restyle_desc(rng: random.Random, desc: str) -> str:
+    """Variação que continua batendo após norm_text (caixa, espaços, stopwords)."""
+    r = rng.random()
+    if r < 0.3:
+        return desc.lower()
+    if r < 0.6:
+        return "  " + desc.replace(" ", "  ") + " "
+    return desc
+
+
+def _diverge_desc(rng: random.Random, desc: str) -> str:
+    return f"{desc} {rng.choice(QUALIFICADORES)}"
+
+
+def _diverge_unit(rng: random.Random, canon: str) -> str:
+    others = [u for u in UNIT_SPELLINGS if u != canon]
+    return _spell_unit(rng, rng.choice(others))
+
+
+def generate_rows(rows: int,
+                  divergence_rate: float = 0.1,
+                  duplicate_rate: float = 0.02,
+                  missing_rate: float = 0.05,
+                  seed: int = 0) -> Dict[str, List[Tuple[object, str, str]]]:
+    """
+    Gera as linhas (cod, descrição, unidade) de cada role.
+
+    - rows: quantidade de itens distintos na aba de módulo
+    - divergence_rate: fração de itens com descrição e/ou unidade divergente em todas as bases
+    - duplicate_rate: fração de linhas repetidas (mesmo COD_SAP) em cada aba
+    - missing_rate: fração de itens do módulo ausentes em todas as bases
+    """
+    rng = random.Random(seed)
+    data: Dict[str, List[Tuple[object, str, str]]] = {role: [] for role in SHEETS_DEFAULT}
+
+    for i in range(rows):
+        # COD_SAP numérico às vezes vem como float do Excel (ex.: 1000123.0)
+        cod_int = 1_000_000 + i
+        desc, canon = _make_item(rng)
+
+        cod_modulo = float(cod_int) if rng.random() < 0.1 else str(cod_int)
+        data["modulo"].append((cod_modulo, desc, _spell_unit(rng, canon)))
+
+        if rng.random() < missing_rate:
+            continue
+
+        # A divergência vale para todas as bases do item; caso contrário alguma base
+        # bateria e o status final seria OK
+        diverge_desc = diverge_un = False
+        if rng.random() < divergence_rate:
+            kind = rng.random()
+            diverge_desc = kind < 0.45 or kind >= 0.9
+            diverge_un = kind >= 0.45
+
+        for role in ("sap", "orca", "caderno"):
+            # Nem todo item está em todas as bases
+            if rng.random() < 0.1:
+                continue
+            ref_desc = _diverge_desc(rng, desc) if diverge_desc else _restyle_desc(rng, desc)
+            ref_un = _diverge_unit(rng, canon) if diverge_un else _spell_unit(rng, canon)
+            data[role].append((str(cod_int), ref_desc, ref_un))
+
+    for role, items in data.items():
+        n_dup = int(len(items) * duplicate_rate)
+        for _ in range(n_dup):
+            cod, desc, un = rng.choice(items)
+            items.append((cod, _diverge_desc(rng, desc), un))
+        rng.shuffle(items)
+
+    return data
+
+
+def generate_workbook(out_path: Path,
+                      rows: int,
+                      divergence_rate: float = 0.1,
+                      duplicate_rate: float = 0.02,
+                      missing_rate: float = 0.05,
+                      header_variants: bool = True,
+                      seed: int = 0,
+                      sheets: Optional[Dict[str, str]] = None) -> Path:
+    """
+    Grava um .xlsx sintético com as abas de `sheets` (padrão: SHEETS_DEFAULT).
+
+    Usa o modo write_only do openpyxl para suportar até ~1M de linhas com memória
+    constante por linha gravada.
+    """
+    sheets = sheets or SHEETS_DEFAULT
+    rng = random.Random(seed)
+    data = generate_rows(rows, divergence_rate=divergence_rate, duplicate_rate=duplicate_rate,
+                         missing_rate=missing_rate, seed=seed)
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    wb = Workbook(write_only=True)
+    for role, sheet_name in sheets.items():
+        ws = wb.create_sheet(title=sheet_name)
+        ws.append(_headers(rng, role, header_variants))
+        for row in data[role]:
+            ws.append(row)
+    wb.save(out_path)
+    return out_path
+
+
+EMPRESAS = [
+    "CONSTRUTORA ALFA LTDA", "ENGENHARIA BETA S.A.", "SERVIÇOS ELÉTRICOS GAMA", "MONTAGENS DELTA",
+    "ÔMEGA INSTALAÇÕES", "SUBESTAÇÕES ÉPSILON", "TÉCNICA ZETA EIRELI",
+]
+
+
+def generate_contracts_csv(out_path: Path, rows: int, overrun_rate: float = 0.15, seed: int = 0) -> Path:
+    """
+    Grava um CSV sintético de contratos (Empresa, Validade, Valor Fixado, Valor Medido)
+    com valores em formato monetário brasileiro, como o /analyze-contracts espera.
+    """
+    rng = random.Random(seed)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def brl(v: float) -> str:
+        s = f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        return f"R$ {s}"
+
+    with open(out_path, "w", encoding="utf-8", newline="") as fh:
+        w = csv.writer(fh)
+        w.writerow(["Contrato", "Empresa", "Validade", "Valor Fixado", "Valor Medido"])
+        for i in range(rows):
+            fixado = rng.uniform(10_000, 5_000_000)
+            fator = rng.uniform(1.01, 1.4) if rng.random() < overrun_rate else rng.uniform(0.1, 1.0)
+            validade = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2020, 2030)}"
+            w.writerow([f"CT-{i:06d}", rng.choice(EMPRESAS), validade, brl(fixado), brl(fixado * fator)])
+    return out_path
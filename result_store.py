@@ -0,0 +1,289 @@
+"""
+Armazenamento consultável dos resultados da análise de módulos (SQLite, por token).
+
+Cada análise grava uma linha por COD_SAP com os campos brutos, os flags existe_no_* /
+match_*, status_desc/status_un e o tipo_erro (NULL quando a linha está OK). A aba
+'erros' é o subconjunto com tipo_erro preenchido, então as duas visões ficam numa única
+tabela indexada e as consultas não dependem de abrir o .xlsx.
+"""
+from __future__ import annotations
+
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from itertools import repeat
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+COL_COD = "COD_SAP"
+
+# Colunas persistidas: (coluna no DataFrame de análise, coluna no SQLite, tipo)
+STORE_COLUMNS = [
+    (COL_COD, "cod_sap", "TEXT NOT NULL"),
+    ("desc_modulo_raw", "desc_modulo_raw", "TEXT"),
+    ("un_modulo_raw", "un_modulo_raw", "TEXT"),
+    ("sap_desc_raw", "sap_desc_raw", "TEXT"),
+    ("sap_un_raw", "sap_un_raw", "TEXT"),
+    ("orca_desc_raw", "orca_desc_raw", "TEXT"),
+    ("orca_un_raw", "orca_un_raw", "TEXT"),
+    ("cad_desc_raw", "cad_desc_raw", "TEXT"),
+    ("cad_un_raw", "cad_un_raw", "TEXT"),
+    ("existe_no_sap", "existe_no_sap", "INTEGER"),
+    ("existe_no_orcafascio", "existe_no_orcafascio", "INTEGER"),
+    ("existe_no_caderno", "existe_no_caderno", "INTEGER"),
+    ("match_desc_modulo_sap", "match_desc_modulo_sap", "INTEGER"),
+    ("match_desc_modulo_orca", "match_desc_modulo_orca", "INTEGER"),
+    ("match_desc_modulo_caderno", "match_desc_modulo_caderno", "INTEGER"),
+    ("match_un_modulo_sap", "match_un_modulo_sap", "INTEGER"),
+    ("match_un_modulo_orca", "match_un_modulo_orca", "INTEGER"),
+    ("match_un_modulo_caderno", "match_un_modulo_caderno", "INTEGER"),
+    ("status_desc", "status_desc", "TEXT"),
+    ("status_un", "status_un", "TEXT"),
+    ("tipo_erro", "tipo_erro", "TEXT"),
+]
+
+# base -> (existe_no_*, match_desc_*, match_un_*): "divergente em relação à base"
+BASE_COLUMNS = {
+    "sap": ("existe_no_sap", "match_desc_modulo_sap", "match_un_modulo_sap"),
+    "orca": ("existe_no_orcafascio", "match_desc_modulo_orca", "match_un_modulo_orca"),
+    "caderno": ("existe_no_caderno", "match_desc_modulo_caderno", "match_un_modulo_caderno"),
+}
+
+SORTABLE = {"cod_sap", "status_desc", "status_un", "tipo_erro"}
+VIEWS = {"analysis", "erros"}
+MAX_PAGE_SIZE = 500
+
+# Estado da gravação em runs.status: a linha nasce 'gravando' antes de a escrita ser
+# agendada, para que qualquer worker distinga "em andamento" de "falhou"/"inexistente"
+RUN_WRITING, RUN_OK, RUN_FAILED = "gravando", "ok", "falhou"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    token TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    n_rows INTEGER NOT NULL,
+    n_erros INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'ok'
+);
+CREATE TABLE IF NOT EXISTS resultados (
+    token TEXT NOT NULL,
+    {", ".join(f"{sql} {typ}" for _, sql, typ in STORE_COLUMNS)},
+    PRIMARY KEY (token, cod_sap)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_resultados_tipo ON resultados (token, tipo_erro, cod_sap);
+CREATE INDEX IF NOT EXISTS ix_resultados_status ON resultados (token, status_desc, status_un, cod_sap);
+CREATE INDEX IF NOT EXISTS ix_resultados_status_un ON resultados (token, status_un, cod_sap);
+CREATE INDEX IF NOT EXISTS ix_resultados_status_desc ON resultados (token, status_desc, cod_sap);
+"""
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """
+    Abre o banco (criando o schema se preciso) em modo WAL, seguro para várias threads/processos.
+
+    O banco usa auto_vacuum=INCREMENTAL para poder devolver ao disco as páginas liberadas
+    por delete_results; bancos criados antes disso são convertidos com um VACUUM único.
+    """
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_path, timeout=30)
+    con.row_factory = sqlite3.Row
+    # 2 = INCREMENTAL; precisa vir antes de criar tabelas (ou de um VACUUM)
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(_SCHEMA)
+    # Bancos anteriores à coluna status: as execuções já gravadas estão completas
+    if "status" not in {r["name"] for r in con.execute("PRAGMA table_info(runs)")}:
+        with con:
+            con.execute("ALTER TABLE runs ADD COLUMN status TEXT NOT NULL DEFAULT 'ok'")
+    return con
+
+
+def _set_run(con: sqlite3.Connection, token: str, status: str,
+             n_rows: int = 0, n_erros: int = 0) -> None:
+    con.execute(
+        "INSERT OR REPLACE INTO runs (token, created_at, n_rows, n_erros, status) VALUES (?, ?, ?, ?, ?)",
+        (token, datetime.now().isoformat(timespec="seconds"), n_rows, n_erros, status),
+    )
+
+
+def start_run(db_path: Path, token: str) -> None:
+    """Registra `token` como 'gravando' (chamar antes de agendar save_results)."""
+    with closing(connect(db_path)) as con, con:
+        _set_run(con, token, RUN_WRITING)
+
+
+def fail_run(db_path: Path, token: str) -> None:
+    """Marca a gravação de `token` como falha e descarta linhas parciais."""
+    with closing(connect(db_path)) as con, con:
+        con.execute("DELETE FROM resultados WHERE token = ?", (token,))
+        _set_run(con, token, RUN_FAILED)
+
+
+def run_status(db_path: Path, token: str) -> Optional[Dict]:
+    """{'status', 'created_at'} da execução de `token`, ou None se ela não existir."""
+    if not Path(db_path).exists():
+        return None
+    with closing(connect(db_path)) as con:
+        row = con.execute("SELECT status, created_at FROM runs WHERE token = ?", (token,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def _column_values(s: Optional[pd.Series], n: int) -> list:
+    """
+    Valores da coluna como lista Python, com None nos nulos.
+
+    Converte uma coluna por vez (inclusive string/bool[pyarrow]), sem a cópia object
+    do dataframe inteiro.
+    """
+    if s is None:
+        return [None] * n
+    return s.to_numpy(dtype=object, na_value=None).tolist()
+
+
+def save_results(db_path: Path, token: str, analysis: pd.DataFrame, errors: pd.DataFrame) -> int:
+    """
+    Persiste `analysis` + o tipo_erro de `errors` sob `token` (substituindo o que houver).
+
+    `errors` deve ser o retorno de build_errors(analysis), que preserva o índice de analysis.
+    Retorna a quantidade de linhas gravadas.
+    """
+    n = len(analysis)
+    tipo = errors["tipo_erro"].reindex(analysis.index) if "tipo_erro" in errors else None
+    columns = [
+        _column_values(tipo if src == "tipo_erro" else analysis.get(src), n)
+        for src, _, _ in STORE_COLUMNS
+    ]
+    rows = list(zip(repeat(token), *columns))
+
+    sql_cols = ["token"] + [sql for _, sql, _ in STORE_COLUMNS]
+    insert = (
+        f"INSERT OR REPLACE INTO resultados ({', '.join(sql_cols)}) "
+        f"VALUES ({', '.join('?' for _ in sql_cols)})"
+    )
+    n_erros = int(tipo.notna().sum()) if tipo is not None else 0
+
+    with closing(connect(db_path)) as con, con:
+        con.execute("DELETE FROM resultados WHERE token = ?", (token,))
+        con.executemany(insert, rows)
+        _set_run(con, token, RUN_OK, len(rows), n_erros)
+    return len(rows)
+
+
+def _split_values(v) -> List[str]:
+    """Aceita lista ou string separada por vírgula (formato da query string)."""
+    if v is None:
+        return []
+    items = v if isinstance(v, (list, tuple)) else str(v).split(",")
+    return [str(x).strip() for x in items if str(x).strip()]
+
+
+def query_results(db_path: Path, token: str,
+                  view: str = "erros",
+                  tipo_erro: Optional[Sequence[str]] = None,
+                  status_desc: Optional[Sequence[str]] = None,
+                  status_un: Optional[Sequence[str]] = None,
+                  base: Optional[str] = None,
+                  cod_prefix: Optional[str] = None,
+                  sort: str = "cod_sap",
+                  order: str = "asc",
+                  page: int = 1,
+                  page_size: int = 100,
+                  with_total: bool = True) -> Dict:
+    """
+    Consulta paginada/ordenada dos resultados de `token`.
+
+    - view: 'erros' (só linhas com tipo_erro) ou 'analysis' (todas)
+    - tipo_erro, status_desc, status_un: listas (ou CSV) de valores aceitos
+    - base: 'sap' | 'orca' | 'caderno' -> itens presentes na base e divergentes dela
+    - cod_prefix: prefixo do COD_SAP (busca por faixa no índice, sem LIKE)
+
+    Levanta ValueError para parâmetros inválidos e LookupError se o token não existir ou
+    a gravação não tiver terminado com sucesso (ver run_status).
+    """
+    if view not in VIEWS:
+        raise ValueError(f"view inválida: {view}. Use {sorted(VIEWS)}")
+    if sort not in SORTABLE:
+        raise ValueError(f"sort inválido: {sort}. Use {sorted(SORTABLE)}")
+    order = order.lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("order deve ser 'asc' ou 'desc'")
+    page = max(int(page), 1)
+    page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+
+    where = ["token = ?"]
+    params: List[object] = [token]
+
+    if view == "erros":
+        where.append("tipo_erro IS NOT NULL")
+    for col, values in (("tipo_erro", tipo_erro), ("status_desc", status_desc), ("status_un", status_un)):
+        vals = _split_values(values)
+        if vals:
+            where.append(f"{col} IN ({', '.join('?' for _ in vals)})")
+            params.extend(vals)
+    if base:
+        if base not in BASE_COLUMNS:
+            raise ValueError(f"base inválida: {base}. Use {sorted(BASE_COLUMNS)}")
+        existe, m_desc, m_un = BASE_COLUMNS[base]
+        where.append(f"{existe} = 1 AND ({m_desc} = 0 OR {m_un} = 0)")
+    if cod_prefix:
+        # Faixa [prefixo, prefixo + U+FFFF) usa o índice, ao contrário de LIKE 'x%'
+        where.append("cod_sap >= ? AND cod_sap < ?")
+        params.extend([cod_prefix, cod_prefix + "\uffff"])
+
+    where_sql = " AND ".join(where)
+    order_sql = f"{sort} {order}" + ("" if sort == "cod_sap" else f", cod_sap {order}")
+
+    with closing(connect(db_path)) as con:
+        run = con.execute("SELECT status FROM runs WHERE token = ?", (token,)).fetchone()
+        if run is None or run["status"] != RUN_OK:
+            raise LookupError(f"Resultado não encontrado para o token {token}")
+
+        cur = con.execute(
+            f"SELECT {', '.join(sql for _, sql, _ in STORE_COLUMNS)} FROM resultados "
+            f"WHERE {where_sql} ORDER BY {order_sql} LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size],
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+
+        total = None
+        if with_total:
+            total = con.execute(f"SELECT COUNT(*) FROM resultados WHERE {where_sql}", params).fetchone()[0]
+
+    for r in rows:
+        for _, sql, typ in STORE_COLUMNS:
+            if typ == "INTEGER" and r[sql] is not None:
+                r[sql] = bool(r[sql])
+
+    return {
+        "token": token,
+        "view": view,
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "rows": rows,
+    }
+
+
+def delete_results(db_path: Path, tokens: Sequence[str]) -> int:
+    """Remove os resultados dos tokens (ex.: relatórios expirados pelo janitor) e encolhe o arquivo."""
+    tokens = list(tokens)
+    if not tokens or not Path(db_path).exists():
+        return 0
+    with closing(connect(db_path)) as con:
+        with con:
+            marks = ", ".join("?" for _ in tokens)
+            n = con.execute(f"DELETE FROM resultados WHERE token IN ({marks})", tokens).rowcount
+            con.execute(f"DELETE FROM runs WHERE token IN ({marks})", tokens)
+        # Devolve as páginas livres ao sistema de arquivos e zera o WAL; sem isso o
+        # arquivo nunca encolhe e a cota de armazenamento não tem efeito sobre ele
+        # executescript roda o pragma até o fim (execute libera só uma página por passo)
+        con.executescript("PRAGMA incremental_vacuum;")
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return n
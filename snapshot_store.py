@@ -0,0 +1,173 @@
+"""
+Snapshots compactos de cada análise, agrupados por projeto, e deltas entre execuções.
+
+Um snapshot guarda só o necessário para comparar execuções: COD_SAP, status_desc,
+status_un, tipo_erro e hashes (uint64) dos campos normalizados do módulo e das bases.
+Fica em CSV gzip em <base_dir>/<projeto>/<timestamp>_<token>.csv.gz, então o delta entre
+duas execuções é um merge por COD_SAP de dois arquivos pequenos, sem reabrir os relatórios.
+"""
+from __future__ import annotations
+
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+COL_COD = "COD_SAP"
+
+SNAPSHOT_SUFFIX = ".csv.gz"
+
+# hash -> colunas normalizadas que o compõem
+HASH_FIELDS = {
+    "h_desc_modulo": ["desc_modulo_norm"],
+    "h_un_modulo": ["un_modulo_norm"],
+    "h_ref": [
+        "sap_desc_norm", "sap_un_norm",
+        "orca_desc_norm", "orca_un_norm",
+        "cad_desc_norm", "cad_un_norm",
+    ],
+}
+
+STATUS_FIELDS = ["status_desc", "status_un", "tipo_erro"]
+SNAPSHOT_COLUMNS = [COL_COD] + STATUS_FIELDS + list(HASH_FIELDS)
+
+_RE_PROJECT = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def project_slug(project: Optional[str]) -> str:
+    """Nome de projeto seguro para usar como diretório ('default' se vazio)."""
+    slug = _RE_PROJECT.sub("_", (project or "").strip()).strip("._")
+    return slug or "default"
+
+
+def build_snapshot(analysis: pd.DataFrame, errors: pd.DataFrame) -> pd.DataFrame:
+    """Reduz analysis/erros às colunas do snapshot (um registro por COD_SAP)."""
+    import pandas as pd
+
+    snap = pd.DataFrame({COL_COD: analysis[COL_COD].astype(str)}, index=analysis.index)
+    snap["status_desc"] = analysis["status_desc"]
+    snap["status_un"] = analysis["status_un"]
+    snap["tipo_erro"] = errors["tipo_erro"].reindex(analysis.index) if "tipo_erro" in errors else None
+    snap["tipo_erro"] = snap["tipo_erro"].fillna("OK")
+
+    for name, cols in HASH_FIELDS.items():
+        present = [c for c in cols if c in analysis.columns]
+        if not present:
+            snap[name] = 0
+            continue
+        # hash_pandas_object usa chave fixa: o mesmo texto gera o mesmo hash entre execuções
+        snap[name] = pd.util.hash_pandas_object(
+            analysis[present].fillna("").astype(str), index=False
+        ).to_numpy()
+    return snap[SNAPSHOT_COLUMNS].reset_index(drop=True)
+
+
+def save_snapshot(base_dir: Path, project: Optional[str], token: str,
+                  analysis: pd.DataFrame, errors: pd.DataFrame) -> Path:
+    """Grava o snapshot da análise `token` no projeto e devolve o caminho do arquivo."""
+    proj_dir = Path(base_dir) / project_slug(project)
+    proj_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    path = proj_dir / f"{stamp}_{token}{SNAPSHOT_SUFFIX}"
+    build_snapshot(analysis, errors).to_csv(path, index=False, compression="gzip")
+    return path
+
+
+def list_snapshots(base_dir: Path, project: Optional[str]) -> List[Dict[str, str]]:
+    """Snapshots do projeto em ordem cronológica: [{token, created_at, path}, ...]."""
+    proj_dir = Path(base_dir) / project_slug(project)
+    if not proj_dir.is_dir():
+        return []
+    out = []
+    for p in sorted(proj_dir.glob(f"*{SNAPSHOT_SUFFIX}")):
+        stamp, _, token = p.name[: -len(SNAPSHOT_SUFFIX)].partition("_")
+        try:
+            created = datetime.strptime(stamp, "%Y%m%dT%H%M%S%f").isoformat()
+        except ValueError:
+            continue
+        out.append({"token": token, "created_at": created, "path": str(p)})
+    return out
+
+
+def load_snapshot(base_dir: Path, project: Optional[str], token: str) -> pd.DataFrame:
+    import pandas as pd
+
+    for snap in list_snapshots(base_dir, project):
+        if snap["token"] == token:
+            # UInt64 (nullável): no merge outer o lado ausente vira <NA> em vez de
+            # converter a coluna para float64 e arredondar os hashes
+            dtypes = {COL_COD: str, **{c: "category" for c in STATUS_FIELDS},
+                      **{h: "UInt64" for h in HASH_FIELDS}}
+            return pd.read_csv(snap["path"], dtype=dtypes, keep_default_na=False,
+                               compression="gzip")
+    raise LookupError(f"Snapshot {token} não encontrado no projeto '{project_slug(project)}'")
+
+
+def compute_delta(old: pd.DataFrame, new: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Compara dois snapshots por COD_SAP (merge único, vetorizado).
+
+    - new: com erro em `new` e OK (ou ausente) em `old`
+    - resolved: com erro em `old` e OK em `new`
+    - changed: com erro nos dois, mas status/tipo_erro ou hashes diferentes
+    - removed: com erro em `old` e ausente em `new`
+    """
+    import pandas as pd
+
+    m = old.merge(new, on=COL_COD, how="outer", suffixes=("_old", "_new"), indicator=True)
+
+    err_old = m["tipo_erro_old"].astype(object).fillna("OK") != "OK"
+    err_new = m["tipo_erro_new"].astype(object).fillna("OK") != "OK"
+    in_new = m["_merge"] != "left_only"
+    both = m["_merge"] == "both"
+
+    # Só linhas presentes nas duas execuções são comparadas campo a campo
+    diff = pd.Series(False, index=m.index)
+    for c in STATUS_FIELDS:
+        diff |= m[f"{c}_old"].astype(object) != m[f"{c}_new"].astype(object)
+    for h in HASH_FIELDS:
+        diff |= (m[f"{h}_old"] != m[f"{h}_new"]).fillna(False).astype(bool)
+    diff &= both
+
+    masks = {
+        "new": err_new & ~err_old,
+        "resolved": err_old & ~err_new & in_new,
+        "changed": err_old & err_new & diff,
+        "removed": err_old & ~in_new,
+    }
+    cols = [COL_COD] + [f"{c}_{s}" for c in STATUS_FIELDS for s in ("old", "new")]
+    return {k: m.loc[mask, cols].sort_values(COL_COD).reset_index(drop=True) for k, mask in masks.items()}
+
+
+def delta_between(base_dir: Path, project: Optional[str],
+                  from_token: Optional[str] = None, to_token: Optional[str] = None,
+                  limit: Optional[int] = 1000) -> Dict:
+    """
+    Delta entre duas execuções do projeto. Sem tokens, compara a penúltima com a última.
+
+    Retorna contagens de cada categoria e até `limit` itens por categoria (JSON-serializável).
+    """
+    snaps = list_snapshots(base_dir, project)
+    if not from_token or not to_token:
+        if len(snaps) < 2:
+            raise LookupError(f"O projeto '{project_slug(project)}' precisa de ao menos 2 snapshots")
+        from_token = from_token or snaps[-2]["token"]
+        to_token = to_token or snaps[-1]["token"]
+
+    delta = compute_delta(load_snapshot(base_dir, project, from_token),
+                          load_snapshot(base_dir, project, to_token))
+
+    def records(df: pd.DataFrame) -> List[dict]:
+        df = df.head(limit) if limit else df
+        return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+    return {
+        "project": project_slug(project),
+        "from": from_token,
+        "to": to_token,
+        "counts": {k: int(len(v)) for k, v in delta.items()},
+        "items": {k: records(v) for k, v in delta.items()},
+    }
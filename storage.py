@@ -0,0 +1,365 @@
+"""
+Ciclo de vida dos arquivos em disco (uploads temporários e relatórios gerados).
+
+- Relatórios ficam em diretórios fragmentados pelo token (reports/ab/cd/comparacao_<token>.xlsx),
+  então nenhum diretório cresce sem limite e /download/<token> resolve o caminho direto, em O(1).
+- Uploads são gravados em streaming num arquivo temporário e apagados logo após o parse.
+- Um janitor em segundo plano remove relatórios acima do TTL, mantém só os snapshots mais
+  recentes de cada projeto e, se a cota de bytes (relatórios + snapshots + banco de
+  resultados) for excedida, remove relatórios e snapshots, os mais antigos primeiro.
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from snapshot_store import SNAPSHOT_SUFFIX
+
+REPORT_PREFIX = "comparacao_"
+REPORT_SUFFIX = ".xlsx"
+
+_RE_TOKEN = re.compile(r"[0-9a-f]{32}")
+
+# Temporários de upload mais velhos que isso são sobras de processos que caíram
+STALE_UPLOAD_SECONDS = 3600
+
+
+def is_valid_token(token: str) -> bool:
+    return bool(_RE_TOKEN.fullmatch(token or ""))
+
+
+def _walk_files(root: Path) -> Iterator[os.DirEntry]:
+    """Percorre recursivamente com os.scandir (sem stat extra por arquivo no Linux)."""
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def _stat(entry: os.DirEntry) -> Optional[os.stat_result]:
+    """stat da entrada, ou None se o arquivo sumiu durante a varredura (upload/relatório removido)."""
+    try:
+        return entry.stat(follow_symlinks=False)
+    except FileNotFoundError:
+        return None
+
+
+def _token_from_report(name: str) -> Optional[str]:
+    if name.startswith(REPORT_PREFIX) and name.endswith(REPORT_SUFFIX):
+        token = name[len(REPORT_PREFIX):-len(REPORT_SUFFIX)]
+        return token if is_valid_token(token) else None
+    return None
+
+
+class StorageManager:
+    """
+    Gerencia reports_dir (relatórios fragmentados) e uploads_dir (temporários).
+
+    - ttl_seconds: idade máxima de um relatório (None = sem TTL)
+    - max_bytes: cota total de relatórios + snapshots + banco de resultados (None = sem cota)
+    - legacy_dir: diretório plano antigo (outputs/) ainda consultado no download e varrido pelo janitor
+    - on_evict: chamado com a lista de tokens removidos (ex.: apagar linhas do result_store)
+    - results_db: banco SQLite do result_store (medido com -wal/-shm, conta para a cota)
+    - snapshots_dir: raiz dos snapshots por projeto (snapshot_store)
+    - snapshot_keep: quantos snapshots mais recentes manter por projeto (None = todos)
+    """
+
+    def __init__(self, reports_dir: Path, uploads_dir: Path,
+                 ttl_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = None,
+                 legacy_dir: Optional[Path] = None,
+                 on_evict: Optional[Callable[[List[str]], None]] = None,
+                 results_db: Optional[Path] = None,
+                 snapshots_dir: Optional[Path] = None,
+                 snapshot_keep: Optional[int] = None):
+        self.reports_dir = Path(reports_dir)
+        self.uploads_dir = Path(uploads_dir)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.legacy_dir = Path(legacy_dir) if legacy_dir else None
+        self.on_evict = on_evict
+        self.results_db = Path(results_db) if results_db else None
+        self.snapshots_dir = Path(snapshots_dir) if snapshots_dir else None
+        self.snapshot_keep = snapshot_keep
+        self.reports_dir.mkdir(parents=True, exist_ok=True)
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_sweep: Optional[Dict] = None
+
+    # --------------------------------------------------------------------------
+    # Layout
+    # --------------------------------------------------------------------------
+
+    def report_path(self, token: str) -> Path:
+        """Caminho fragmentado do relatório (cria os diretórios do shard)."""
+        if not is_valid_token(token):
+            raise ValueError(f"Token inválido: {token!r}")
+        shard = self.reports_dir / token[:2] / token[2:4]
+        shard.mkdir(parents=True, exist_ok=True)
+        return shard / f"{REPORT_PREFIX}{token}{REPORT_SUFFIX}"
+
+    def find_report(self, token: str) -> Optional[Path]:
+        """Localiza o relatório pelo token sem listar diretórios (shard ou legado)."""
+        if not is_valid_token(token):
+            return None
+        name = f"{REPORT_PREFIX}{token}{REPORT_SUFFIX}"
+        p = self.reports_dir / token[:2] / token[2:4] / name
+        if p.is_file():
+            return p
+        if self.legacy_dir is not None:
+            p = self.legacy_dir / name
+            if p.is_file():
+                return p
+        return None
+
+    @contextmanager
+    def temp_upload(self, file_storage, suffix: str = "") -> Iterator[Path]:
+        """
+        Grava o upload (werkzeug FileStorage) em streaming num temporário e o apaga ao sair.
+
+        Uso:
+            with STORAGE.temp_upload(f, suffix=".xlsx") as in_path:
+                ...parse...
+        """
+        fd, name = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=self.uploads_dir)
+        path = Path(name)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                file_storage.save(fh)
+            yield path
+        finally:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    # --------------------------------------------------------------------------
+    # Retenção
+    # --------------------------------------------------------------------------
+
+    def _report_entries(self) -> List[Tuple[float, int, str, Optional[str]]]:
+        """(mtime, tamanho, caminho, token) de todos os relatórios, shards e legado."""
+        out = []
+        for entry in _walk_files(self.reports_dir):
+            st = _stat(entry)
+            if st is not None:
+                out.append((st.st_mtime, st.st_size, entry.path, _token_from_report(entry.name)))
+        if self.legacy_dir is not None and self.legacy_dir.is_dir():
+            with os.scandir(self.legacy_dir) as it:
+                for entry in it:
+                    token = _token_from_report(entry.name)
+                    if token and entry.is_file(follow_symlinks=False):
+                        st = _stat(entry)
+                        if st is not None:
+                            out.append((st.st_mtime, st.st_size, entry.path, token))
+        return out
+
+    def _snapshot_entries(self) -> List[Tuple[float, int, str, Optional[str]]]:
+        """(mtime, tamanho, caminho, projeto) dos snapshots de todos os projetos."""
+        if self.snapshots_dir is None:
+            return []
+        out = []
+        for entry in _walk_files(self.snapshots_dir):
+            if not entry.name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            st = _stat(entry)
+            if st is not None:
+                out.append((st.st_mtime, st.st_size, entry.path, Path(entry.path).parent.name))
+        return out
+
+    def _db_bytes(self) -> int:
+        """Tamanho do banco de resultados com os arquivos -wal/-shm do modo WAL."""
+        if self.results_db is None:
+            return 0
+        total = 0
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                total += os.stat(f"{self.results_db}{suffix}").st_size
+            except FileNotFoundError:
+                continue
+        return total
+
+    def _unlink(self, path: str, root: Path) -> bool:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        self._prune_empty_dirs(Path(path).parent, root)
+        return True
+
+    def _evict(self, tokens: List[str]) -> None:
+        if tokens and self.on_evict is not None:
+            self.on_evict(tokens)
+
+    def sweep(self, now: Optional[float] = None) -> Dict:
+        """
+        Aplica a retenção e limpa temporários órfãos. Devolve um resumo.
+
+        1) relatórios acima do TTL (e suas linhas no banco, via on_evict)
+        2) snapshots além dos `snapshot_keep` mais recentes de cada projeto
+        3) cota: relatórios + snapshots + banco de resultados; remove relatórios e
+           snapshots, os mais antigos primeiro, até caber. O banco não é apagado, mas
+           encolhe a cada relatório removido (on_evict + incremental vacuum) e é medido
+           de novo a cada remoção.
+        """
+        now = time.time() if now is None else now
+        freed = 0
+        tokens: List[str] = []
+        snaps_removed = 0
+        with self._lock:
+            keep = []
+            expired = []
+            for mtime, size, path, token in sorted(self._report_entries()):
+                if self.ttl_seconds is not None and now - mtime > self.ttl_seconds:
+                    if self._unlink(path, self.reports_dir):
+                        freed += size
+                        if token:
+                            expired.append(token)
+                else:
+                    keep.append((mtime, size, path, token, "report"))
+            self._evict(expired)
+            tokens += expired
+
+            by_project: Dict[str, list] = {}
+            for entry in self._snapshot_entries():
+                by_project.setdefault(entry[3], []).append(entry)
+            for project, snaps in by_project.items():
+                # O nome começa pelo timestamp da execução: ordem de nome = cronológica
+                snaps.sort(key=lambda e: Path(e[2]).name)
+                extra = len(snaps) - self.snapshot_keep if self.snapshot_keep is not None else 0
+                for mtime, size, path, _ in snaps[:max(extra, 0)]:
+                    if self._unlink(path, self.snapshots_dir):
+                        freed += size
+                        snaps_removed += 1
+                keep += [(mtime, size, path, None, "snapshot")
+                         for mtime, size, path, _ in snaps[max(extra, 0):]]
+
+            if self.max_bytes is not None:
+                keep.sort()
+                total = sum(e[1] for e in keep) + self._db_bytes()
+                for mtime, size, path, token, kind in keep:
+                    if total <= self.max_bytes:
+                        break
+                    root = self.reports_dir if kind == "report" else self.snapshots_dir
+                    if not self._unlink(path, root):
+                        continue
+                    freed += size
+                    total -= size
+                    if kind == "snapshot":
+                        snaps_removed += 1
+                    elif token:
+                        tokens.append(token)
+                        db_before = self._db_bytes()
+                        self._evict([token])
+                        db_after = self._db_bytes()
+                        freed += max(db_before - db_after, 0)
+                        total += db_after - db_before
+
+            stale = 0
+            for entry in _walk_files(self.uploads_dir):
+                st = _stat(entry)
+                if st is None or now - st.st_mtime <= STALE_UPLOAD_SECONDS:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                    stale += 1
+                except FileNotFoundError:
+                    continue
+
+        self.last_sweep = {
+            "at": now,
+            "removed_reports": len(tokens),
+            "removed_snapshots": snaps_removed,
+            "freed_bytes": freed,
+            "removed_stale_uploads": stale,
+        }
+        return self.last_sweep
+
+    def _prune_empty_dirs(self, d: Path, root: Path) -> None:
+        """Remove diretórios vazios (shards, projetos) até `root`, exclusive."""
+        while d != root and root in d.parents:
+            try:
+                d.rmdir()
+            except OSError:
+                return
+            d = d.parent
+
+    def usage(self) -> Dict:
+        """
+        Estatísticas de uso: relatórios, snapshots, banco de resultados (com -wal/-shm) e
+        uploads em andamento. total_bytes é o que conta para a cota (tudo menos uploads).
+        """
+        entries = self._report_entries()
+        snaps = self._snapshot_entries()
+        db_bytes = self._db_bytes()
+        now = time.time()
+        uploads = [st for st in map(_stat, _walk_files(self.uploads_dir)) if st is not None]
+        reports_bytes = sum(size for _, size, _, _ in entries)
+        snaps_bytes = sum(size for _, size, _, _ in snaps)
+        return {
+            "reports": {
+                "files": len(entries),
+                "bytes": reports_bytes,
+                "oldest_age_s": now - min(m for m, _, _, _ in entries) if entries else None,
+                "newest_age_s": now - max(m for m, _, _, _ in entries) if entries else None,
+            },
+            "snapshots": {
+                "files": len(snaps),
+                "bytes": snaps_bytes,
+                "projects": len({p for _, _, _, p in snaps}),
+            },
+            "results_db": {
+                "bytes": db_bytes,
+            },
+            "uploads": {
+                "files": len(uploads),
+                "bytes": sum(st.st_size for st in uploads),
+            },
+            "total_bytes": reports_bytes + snaps_bytes + db_bytes,
+            "limits": {
+                "ttl_seconds": self.ttl_seconds,
+                "max_bytes": self.max_bytes,
+                "snapshot_keep": self.snapshot_keep,
+            },
+            "last_sweep": self.last_sweep,
+        }
+
+    # --------------------------------------------------------------------------
+    # Janitor
+    # --------------------------------------------------------------------------
+
+    def start_janitor(self, interval_seconds: float = 600) -> None:
+        """Inicia (uma vez) a thread daemon que chama sweep() a cada intervalo."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Erro no janitor de armazenamento: {e}")
+                self._stop.wait(interval_seconds)
+
+        self._thread = threading.Thread(target=loop, name="storage-janitor", daemon=True)
+        self._thread.start()
+
+    def stop_janitor(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None